@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import numpy as np
+
+from common import load_state
+from QGE.batch import equilibrium_batch
+from QGE.equilibrium import equilibrium
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare a loop of equilibrium solves with the '
+                    'scenario-stacked batch on a tariff ladder.')
+    parser.add_argument('--N', type=int, default=None)
+    parser.add_argument('--J', type=int, default=None)
+    parser.add_argument('--solvers', default='krylov')
+    parser.add_argument('--sector', type=int, default=0)
+    parser.add_argument('--levels', default='5,10,15,20,25,30,35,40,45,50')
+    parser.add_argument('--tol', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    p, d = load_state(args.N, args.J)
+    p['tol'] = args.tol
+    N = d['tau'].shape[0]
+
+    # Tariff on every foreign flow of one sector, one scenario per level
+    levels = [float(level) for level in args.levels.split(',')]
+    tau_hat = np.ones((len(levels),) + d['tau'].shape)
+    for s, level in enumerate(levels):
+        tau_hat[s, :, :, args.sector] = 1 + level / 100
+        tau_hat[s, np.arange(N), np.arange(N), args.sector] = 1
+
+    print(f"{'solver':>8} {'mode':>6} {'scenarios':>9} {'seconds':>8} "
+          f"{'per scenario':>12}")
+    for solver in args.solvers.split(','):
+        q = dict(p, ex_solver=solver)
+
+        start = time.perf_counter()
+        for s in range(len(levels)):
+            equilibrium(dict(d, tau_hat=tau_hat[s],
+                             taup=tau_hat[s] * d['tau']), dict(q))
+        loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        equilibrium_batch(d, q, tau_hat)
+        batch = time.perf_counter() - start
+
+        for mode, seconds in (('loop', loop), ('batch', batch)):
+            print(f"{solver:>8} {mode:>6} {len(levels):9d} {seconds:8.2f} "
+                  f"{seconds / len(levels):12.3f}")
+
+
+if __name__ == '__main__':
+    main()
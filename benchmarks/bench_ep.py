@@ -0,0 +1,81 @@
+import argparse
+
+import numpy as np
+
+from common import load_state, timeit
+from QGE.EP import EP
+
+
+def _loop_EP(w_hat, P_hat, d, p):
+    # Per-sector loop implementation of the price iteration, for reference
+    P_err = 1
+    it = 1
+    while P_err > p['tol'] and it < p['maxit']:
+        lw_hat = np.log(w_hat)
+        lP_hat = np.log(P_hat)
+        lw_hat_term = lw_hat.T * p['B']
+        lP_hat_term = np.sum(p['G'] * lP_hat[:, :, None], axis=0).T
+        c_hat = np.exp(lw_hat_term + lP_hat_term)
+        pni_hat = np.empty((p['N'], p['N'], p['J']))
+        for j in range(p['J']):
+            pni_hat[:, :, j] = (c_hat[j, :][None, :] *
+                                d['tau_hat'][:, :, j]) ** (-p['theta'][j])
+        log_sum = np.log(np.sum(d['pi'] * pni_hat, axis=1))
+        P_hat1 = np.exp(log_sum.T / (-p['theta'][:, None]))
+        P_err = np.max(np.abs(P_hat1 - P_hat))
+        it += 1
+        P_hat = P_hat1.copy()
+    Pn_hat = np.prod(P_hat**p['alpha'], axis=0)
+    return P_hat, c_hat, Pn_hat
+
+
+def _price_inputs(N, J, seed=0):
+    # Only what EP reads; avoids calibrating a full model at large sizes
+    rng = np.random.default_rng(seed)
+    B = rng.uniform(0.3, 0.6, size=(J, N))
+    gamma = rng.dirichlet(np.ones(J), size=(N, J))
+    pi = rng.uniform(0.0, 1.0, size=(N, N, J))
+    pi[np.arange(N), np.arange(N), :] += 3 * N
+    pi /= np.sum(pi, axis=1, keepdims=True)
+    p = {
+        'N': N, 'J': J, 'tol': 1e-10, 'maxit': 1e10, 'B': B,
+        'G': np.transpose(gamma, (2, 0, 1)) * (1 - B.T)[None, :, :],
+        'alpha': rng.dirichlet(np.ones(J), size=N).T,
+        'theta': rng.uniform(1.0, 5.0, size=J),
+    }
+    d = {'pi': pi, 'tau_hat': np.ones((N, N, J))}
+    return p, d
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the EP kernel.')
+    parser.add_argument('--sizes', default='77x45,150x45,150x90')
+    parser.add_argument('--tariff', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes.split(','):
+        N, J = (int(x) for x in size.split('x'))
+        if (N, J) == (77, 45):
+            p, d = load_state()
+        else:
+            p, d = _price_inputs(N, J)
+        rng = np.random.default_rng(1)
+        d['tau_hat'] = 1 + args.tariff * rng.uniform(size=(N, N, J))
+        w_hat = rng.uniform(0.9, 1.1, size=N)
+        P_hat = np.ones((J, N))
+
+        t_loop, expected = timeit(lambda: _loop_EP(w_hat, P_hat, d, p),
+                                  args.repeat)
+        ws = {}
+        t_vec, result = timeit(lambda: EP(w_hat, P_hat, d, p, ws=ws),
+                               args.repeat)
+        err = max(np.max(np.abs(r - e) / np.abs(e))
+                  for r, e in zip(result, expected))
+        print(f"N = {N:4d}, J = {J:3d}: loop {t_loop * 1e3:9.1f} ms, "
+              f"vectorized {t_vec * 1e3:9.1f} ms, "
+              f"speedup {t_loop / t_vec:5.2f}x, max rel diff {err:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import argparse
+
+from common import load_state, scenarios
+from QGE.equilibrium import equilibrium
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inner EP sweeps with and without Anderson acceleration.')
+    parser.add_argument('--N', type=int, default=None)
+    parser.add_argument('--J', type=int, default=None)
+    parser.add_argument('--depth', type=int, default=5)
+    args = parser.parse_args()
+
+    p, d = load_state(args.N, args.J)
+    p.update({'tol': 1e-6, 'ex_solver': 'krylov'})
+
+    total = {0: 0, args.depth: 0}
+    for label, tau_hat in scenarios(d):
+        d['tau_hat'] = tau_hat
+        d['taup'] = tau_hat * d['tau']
+        sweeps = {}
+        for depth in total:
+            p['ep_anderson'] = depth
+            sweeps[depth] = equilibrium(d, p)['ep_it']
+            total[depth] += sweeps[depth]
+        print(f"{label:>22}: picard {sweeps[0]:6d}, "
+              f"anderson({args.depth}) {sweeps[args.depth]:6d}, "
+              f"saved {sweeps[0] - sweeps[args.depth]:6d}")
+    print(f"{'total':>22}: picard {total[0]:6d}, "
+          f"anderson({args.depth}) {total[args.depth]:6d}, "
+          f"saved {total[0] - total[args.depth]:6d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import time
+
+from common import load_state, scenarios
+from QGE.equilibrium import equilibrium
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare equilibrium solver engines on standard scenarios.')
+    parser.add_argument('--N', type=int, default=None)
+    parser.add_argument('--J', type=int, default=None)
+    parser.add_argument('--variants', default='picard,adaptive,newton_krylov')
+    parser.add_argument('--tol', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    p, d = load_state(args.N, args.J)
+    p.update({'tol': args.tol, 'ex_solver': 'krylov'})
+    variants = {
+        'picard': {'eq_solver': 'picard'},
+        'adaptive': {'eq_solver': 'picard', 'lmc_adaptive': True},
+        'inexact': {'eq_solver': 'picard', 'inexact': True},
+        'adaptive+inexact': {'eq_solver': 'picard', 'lmc_adaptive': True,
+                             'inexact': True},
+        'newton_krylov': {'eq_solver': 'newton_krylov'},
+    }
+
+    print(f"{'scenario':>22} {'variant':>14} {'outer':>6} {'evals':>6} "
+          f"{'EP sweeps':>9} {'seconds':>8}")
+    for label, tau_hat in scenarios(d):
+        d['tau_hat'] = tau_hat
+        d['taup'] = tau_hat * d['tau']
+        for variant in args.variants.split(','):
+            start = time.perf_counter()
+            out = equilibrium(d, dict(p, **variants[variant]))
+            seconds = time.perf_counter() - start
+            print(f"{label:>22} {variant:>14} {out['it']:6d} {out['evals']:6d} "
+                  f"{out['ep_it']:9d} {seconds:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
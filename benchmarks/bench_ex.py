@@ -0,0 +1,48 @@
+import argparse
+
+import numpy as np
+
+from common import load_state, shock, timeit
+from QGE.EX import EX, factorize_leontief
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EX solvers.')
+    parser.add_argument('--N', type=int, default=None)
+    parser.add_argument('--J', type=int, default=None)
+    parser.add_argument('--tariff', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    p, d = load_state(args.N, args.J)
+    baseline_lu = factorize_leontief(d['pi'], dict(p), d)
+    d = shock(d, args.tariff)
+    w_hat = np.ones(p['N'])
+
+    cases = [
+        ('dense', {'ex_solver': 'dense'}, False),
+        ('woodbury', {'ex_solver': 'woodbury'}, False),
+        ('krylov', {'ex_solver': 'krylov'}, False),
+        ('krylov (warm)', {'ex_solver': 'krylov'}, True),
+        ('krylov (precond)', {'ex_solver': 'krylov', '_ex_lu': baseline_lu},
+         False),
+    ]
+
+    print(f"N = {p['N']}, J = {p['J']}")
+    reference = None
+    for label, options, warm in cases:
+        p.pop('_ex_lu', None)
+        p.update(options)
+        # Warm start from a nearby solution, as between outer iterations
+        X0 = EX(0.99 * w_hat, d['pi'], p, d)[0] if warm else None
+        seconds, out = timeit(lambda: EX(w_hat, d['pi'], p, d, X0=X0),
+                              args.repeat)
+        X = out[0]
+        if reference is None:
+            reference = X
+        err = np.max(np.abs(X - reference)) / np.max(np.abs(reference))
+        print(f"{label:>18}: {seconds * 1e3:9.1f} ms   max rel diff {err:.2e}")
+
+
+if __name__ == '__main__':
+    main()
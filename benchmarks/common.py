@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+OUTPUT = os.path.join(PROJECT, 'output')
+TESTS_DIR = os.path.join(PROJECT, 'tests')
+
+for path in (CODE_DIR, TESTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from QGE.main import _load_calibrated_state
+from synthetic import synthetic_calibration
+
+
+def load_state(N=None, J=None, seed=0):
+    # The ICIO calibration when it is on disk and no size is requested,
+    # a synthetic calibration of the requested size otherwise.
+    if N is None and os.path.exists(os.path.join(OUTPUT, 'baseline', 'd.npy')):
+        p, d, baseline = _load_calibrated_state(OUTPUT)
+        p, d = dict(p), dict(d)
+        d.update({key: baseline[key] for key in (
+            'X', 'GO', 'Expenditure', 'pi', 'VAnj', 'In', 'xbilat', 'Im', 'Ex')})
+        d['tau_hat'] = d['tau_hat'].copy()
+        return p, d
+    return synthetic_calibration(N or 77, J or 45, seed=seed)
+
+
+def shock(d, tariff=0.2, seed=0):
+    # Random tariff shock on every foreign flow
+    N = d['tau'].shape[0]
+    rng = np.random.default_rng(seed)
+    tau_hat = 1 + tariff * rng.uniform(0.0, 1.0, size=d['tau'].shape)
+    tau_hat[np.arange(N), np.arange(N), :] = 1
+    d['tau_hat'] = tau_hat
+    d['taup'] = tau_hat * d['tau']
+    return d
+
+
+def scenarios(d):
+    # Tariff shocks of increasing size on one exporter, on all foreign flows,
+    # and a free-trade reset
+    N = d['tau'].shape[0]
+    foreign = ~np.eye(N, dtype=bool)[:, :, None]
+    for level in (1.1, 1.5, 2.0):
+        tau_hat = np.ones_like(d['tau'])
+        tau_hat[:, 1, :] = level
+        tau_hat[1, 1, :] = 1
+        yield f'exporter 1 +{(level - 1) * 100:.0f}%', tau_hat
+    for level in (1.25, 2.0):
+        yield f'all foreign +{(level - 1) * 100:.0f}%', np.where(
+            foreign, level, 1.0) * np.ones_like(d['tau'])
+    yield 'free trade', 1 / d['tau']
+
+
+def timeit(fn, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
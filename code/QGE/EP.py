@@ -1,41 +1,127 @@
 import numpy as np
 
 
-def EP(w_hat, P_hat, d, p):
+def _buffer(ws, key, shape):
+    # Reusable work array, allocated on first use or when the shape changes
+    buf = ws.get(key)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape)
+        ws[key] = buf
+    return buf
 
-    P_err = 1
-    it = 1
 
-    while P_err > p['tol'] and it < p['maxit']:
-        # Log wage and prices
-        lw_hat = np.log(w_hat)              # (N, 1)
-        lP_hat = np.log(P_hat)              # (J, N)
+def _anderson_step(x, fx, aa):
+    # Anderson-accelerated update of the fixed point x = F(x) in log prices
+    g = fx - x
+    g_norm = np.max(np.abs(g))
+
+    if aa['n'] and g_norm > aa['g_norm']:
+        # Safeguard: the residual grew, drop the history and take a Picard step
+        aa['n'] = 0
+        aa['restarts'] += 1
+    elif aa['has_prev']:
+        slot = aa['n'] % aa['m']
+        aa['dX'][slot] = x - aa['x']
+        aa['dG'][slot] = g - aa['g']
+        aa['n'] += 1
+
+    aa['x'][:] = x
+    aa['g'][:] = g
+    aa['g_norm'] = g_norm
+    aa['has_prev'] = True
+
+    k = min(aa['n'], aa['m'])
+    if not k:
+        return fx
+
+    dX, dG = aa['dX'][:k], aa['dG'][:k]
+    gamma = np.linalg.lstsq(dG.T, g, rcond=None)[0]
+    aa['steps'] += 1
+    return fx - (dX + dG).T @ gamma
+
+
+def EP(w_hat, P_hat, d, p, ws=None, info=None):
+    N, J = p['N'], p['J']
+    theta = p['theta']                  # (J,)
+    ws = {} if ws is None else ws
+
+    # Labor cost term, fixed within the price iteration
+    lw_hat_term = np.log(w_hat)[None, :] * p['B']  # (1, N) * (J, N) → (J, N)
 
-        # Labor cost term
-        lw_hat_term = lw_hat.T * p['B']     # (1, N) * (J, N) → (J, N)
+    # Trade costs in log space, scaled by -theta: (N, N, J)
+    ltau_theta = _buffer(ws, 'ltau_theta', (N, N, J))
+    np.log(d['tau_hat'], out=ltau_theta)
+    ltau_theta *= -theta
 
-        # Intermediate input term
-        lP_hat_term = np.sum(p['G'] * lP_hat[:, :, None], axis=0).T  # (J, N)
+    lP_hat = _buffer(ws, 'lP_hat', (J, N))
+    np.log(P_hat, out=lP_hat)
+    lP_hat1 = _buffer(ws, 'lP_hat1', (J, N))
+    P_hat = np.array(P_hat, dtype=float)            # (J, N)
+    P_hat1 = _buffer(ws, 'P_hat1', (J, N))
 
-        # Total cost change
-        c_hat = np.exp(lw_hat_term + lP_hat_term)  # (J, N)
+    lc_hat = _buffer(ws, 'lc_hat', (J, N))
+    lc_theta = _buffer(ws, 'lc_theta', (N, J))
+    pni_hat = _buffer(ws, 'pni_hat', (N, N, J))
+    log_sum = _buffer(ws, 'log_sum', (N, J))
 
-        # Trade costs adjusted by production costs
-        pni_hat = np.empty((p['N'], p['N'], p['J']))
-        for j in range(p['J']):
-            c_j = c_hat[j, :]  # (N,)
-            tau_j = d['tau_hat'][:, :, j]  # (N, N)
-            pni_hat[:, :, j] = (c_j[None, :] * tau_j) ** (-p['theta'][j])
+    # Optional Anderson acceleration with memory depth p['ep_anderson']
+    m = int(p.get('ep_anderson', 0))
+    aa = None
+    if m:
+        aa = {
+            'm': m, 'n': 0, 'has_prev': False, 'g_norm': np.inf,
+            'steps': 0, 'restarts': 0,
+            'x': _buffer(ws, 'aa_x', (J * N,)),
+            'g': _buffer(ws, 'aa_g', (J * N,)),
+            'dX': _buffer(ws, 'aa_dX', (m, J * N)),
+            'dG': _buffer(ws, 'aa_dG', (m, J * N)),
+        }
+
+    # Stop check set by equilibrium when a time budget or cancel token is given
+    interrupt = p.get('_interrupt')
+
+    P_err = 1
+    it = 1
+
+    while P_err > p['tol'] and it < p['maxit']:
+        # Total cost change in logs: labor plus intermediate input term
+        np.einsum('anj,an->jn', p['G'], lP_hat, out=lc_hat)
+        lc_hat += lw_hat_term
+
+        # Trade costs adjusted by production costs, (c * tau) ** (-theta)
+        np.multiply(lc_hat.T, -theta, out=lc_theta)
+        np.add(ltau_theta, lc_theta[None, :, :], out=pni_hat)
+        np.exp(pni_hat, out=pni_hat)
 
         # Price index
-        log_sum = np.log(np.sum(d['pi'] * pni_hat, axis=1))  # (N, J)
-        P_hat1 = np.exp(log_sum.T / (-p['theta'][:, None]))  # (J, N)
+        pni_hat *= d['pi']
+        np.sum(pni_hat, axis=1, out=log_sum)
+        np.log(log_sum, out=log_sum)
+        np.divide(log_sum.T, -theta[:, None], out=lP_hat1)
+        np.exp(lP_hat1, out=P_hat1)
 
         P_err = np.max(np.abs(P_hat1 - P_hat))
         it += 1
 
-        P_hat = P_hat1.copy()
+        if aa is None or P_err <= p['tol']:
+            lP_hat[...] = lP_hat1
+            P_hat[...] = P_hat1
+        else:
+            lP_hat.flat[:] = _anderson_step(
+                lP_hat.ravel(), lP_hat1.ravel(), aa)
+            np.exp(lP_hat, out=P_hat)
 
+        if interrupt is not None and interrupt():
+            break
+
+    c_hat = np.exp(lc_hat)
+    # pni_hat now holds d['pi'] * (c_hat * tau_hat) ** (-theta) for c_hat
+    ws['pni_c_hat'] = c_hat
     Pn_hat = np.prod(P_hat**p['alpha'], axis=0)
 
+    if info is not None:
+        info['it'] = it - 1
+        info['anderson_steps'] = 0 if aa is None else aa['steps']
+        info['anderson_restarts'] = 0 if aa is None else aa['restarts']
+
     return P_hat, c_hat, Pn_hat
@@ -1,29 +1,14 @@
 import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import LinearOperator, bicgstab, gmres
+from QGE.profiling import stage
 
 
-def EX(w_hat, pi, p, d):
+def _intermediate_matrix(pi, p, d):
 
     Pi_mat = np.transpose(pi, (0, 2, 1))        # (N, J, N)
     Tau_mat = np.transpose(d['taup'], (0, 2, 1))  # (N, J, N)
-    G_mat = p.get('_G_mat')
-    if G_mat is None:
-        G_mat = np.transpose(p['G'], (0, 2, 1))     # (J, J, N)
-        p['_G_mat'] = G_mat
-
-    eye_n = p.get('_eye_n')
-    if eye_n is None:
-        eye_n = np.eye(p['N'])
-        p['_eye_n'] = eye_n
-
-    eye_nj = p.get('_eye_nj')
-    if eye_nj is None:
-        eye_nj = np.eye(p['N'] * p['J'])
-        p['_eye_nj'] = eye_nj
-
-    alpha_weights = p.get('_alpha_weights')
-    if alpha_weights is None:
-        alpha_weights = p['alpha'].T.flatten(order='F')
-        p['_alpha_weights'] = alpha_weights
+    G_mat = np.transpose(p['G'], (0, 2, 1))     # (J, J, N)
 
     M_mat = np.zeros((p['N'], p['J'], p['N'], p['J']))
 
@@ -38,12 +23,29 @@ def EX(w_hat, pi, p, d):
         M_mat[:, :, :, j] = Pi_mat * G_reshaped / Tau_mat
 
     # Now reshape to match MATLAB's linearization (column-major)
-    M_mat = M_mat = np.reshape(
+    return np.reshape(
         M_mat, (p['N'] * p['J'], p['N'] * p['J']), order='F').T
 
+
+def _tariff_revenue_shares(pi, d):
+    # Tariff revenue per unit of expenditure: (N, J)
+    return np.sum(pi * (d['taup'] - 1) / d['taup'], axis=1)
+
+
+def _add_identity(A):
+    # A + I in place, without forming the (N*J, N*J) identity
+    diag = np.arange(A.shape[0])
+    A[diag, diag] += 1
+    return A
+
+
+def _leontief_matrix(pi, p, d):
+
+    M_mat = _intermediate_matrix(pi, p, d)
+
     # Rt_mat_pre: shape (p.N, p.N, p.J)
-    Rt_mat_pre = np.sum(pi * (d['taup'] - 1) / d['taup'], axis=1)[:,
-                                                                  np.newaxis, :] * eye_n[:, :, np.newaxis]
+    Rt_mat_pre = _tariff_revenue_shares(pi, d)[:, np.newaxis, :] * \
+        np.eye(p['N'])[:, :, np.newaxis]
 
     # Concatenate Rt_mat across J horizontally
     Rt_mat = np.hstack([Rt_mat_pre[:, :, j]
@@ -54,7 +56,107 @@ def EX(w_hat, pi, p, d):
     Rt_mat = np.tile(Rt_mat, (p['J'], 1)) * p['alpha'].reshape(-1, 1)
 
     # Leontief matrix
-    Leonteiff = eye_nj - M_mat - Rt_mat
+    Rt_mat += M_mat
+    return _add_identity(np.negative(Rt_mat, out=Rt_mat))
+
+
+def _solve_dense(pi, In_vec, p, d):
+
+    with stage(p, 'EX.assemble'):
+        Leonteiff = _leontief_matrix(pi, p, d)
+
+    with stage(p, 'EX.solve'):
+        return np.linalg.solve(Leonteiff, In_vec)  # (J*N,)
+
+
+def factorize_leontief(pi, p, d):
+    # LU factors of the full Leontief matrix, in the layout used by EX
+    return lu_factor(_leontief_matrix(pi, p, d))
+
+
+def _solve_woodbury(pi, In_vec, p, d):
+    # Rt_mat = U @ V.T has rank N: U spreads country income over sectors
+    # with alpha, V collects tariff revenue from sectoral expenditure.
+    # Factorize only I - M and correct for Rt_mat on an (N, N) system.
+    N, J = p['N'], p['J']
+
+    with stage(p, 'EX.assemble'):
+        A = _add_identity(-_intermediate_matrix(pi, p, d))
+
+        U = np.zeros((J, N, N))
+        U[:, np.arange(N), np.arange(N)] = p['alpha']  # (J, N, N)
+        U = U.reshape((J * N, N))                      # (J*N, N)
+
+        r = _tariff_revenue_shares(pi, d)  # (N, J)
+
+    with stage(p, 'EX.solve'):
+        lu = lu_factor(A)
+
+        # Solve (I - M) Y = [In_vec, U] with a single factorization
+        Y = lu_solve(lu, np.column_stack([In_vec, U]))  # (J*N, 1 + N)
+        Y = Y.reshape((J, N, 1 + N))
+
+        VtY = np.einsum('nj,jnk->nk', r, Y)  # (N, 1 + N)
+
+        # Capacitance system: (I - V.T (I - M)^-1 U) z = V.T (I - M)^-1 In_vec
+        z = np.linalg.solve(np.eye(N) - VtY[:, 1:], VtY[:, 0])  # (N,)
+
+    return (Y[:, :, 0] + Y[:, :, 1:] @ z).reshape(J * N)  # (J*N,)
+
+
+def _leontief_operator(pi, p, d):
+    # Matrix-free (I - M - Rt_mat) acting on X flattened from (J, N)
+    N, J = p['N'], p['J']
+    S = pi / d['taup']                 # (N, N, J)
+    r = _tariff_revenue_shares(pi, d)  # (N, J)
+
+    def matvec(x):
+        X = x.reshape((J, N))
+        GO = np.einsum('nij,jn->ji', S, X)            # (J, N)
+        MX = np.einsum('aij,ji->ai', p['G'], GO)       # (J, N)
+        RtX = p['alpha'] * np.einsum('nj,jn->n', r, X)  # (J, N)
+        return (X - MX - RtX).reshape(J * N)
+
+    return LinearOperator((J * N, J * N), matvec=matvec, dtype=float)
+
+
+def _solve_krylov(pi, In_vec, p, d, X0=None):
+    method = p.get('ex_krylov', 'gmres')
+    if method == 'gmres':
+        krylov = gmres
+    elif method == 'bicgstab':
+        krylov = bicgstab
+    else:
+        raise ValueError(f"Unknown EX Krylov method: {method}")
+
+    # Warm start from the output of the previous outer iteration
+    x0 = None if X0 is None else X0.reshape(p['N'] * p['J'])
+
+    # Precondition with a reference factorization (e.g. the baseline
+    # Leontief matrix) when one is attached to p
+    lu = p.get('_ex_lu')
+    M = None
+    if lu is not None:
+        M = LinearOperator((p['N'] * p['J'], p['N'] * p['J']),
+                           matvec=lambda x: lu_solve(lu, x), dtype=float)
+
+    with stage(p, 'EX.assemble'):
+        A = _leontief_operator(pi, p, d)
+
+    with stage(p, 'EX.solve'):
+        x, info = krylov(A, In_vec, x0=x0, M=M,
+                         rtol=p.get('ex_tol', 1e-12), atol=0.0,
+                         maxiter=int(p.get('ex_maxit', 1_000)))
+    if info != 0:
+        raise RuntimeError(
+            f"EX {method} solve did not converge (info = {info})")
+
+    return x
+
+
+def EX(w_hat, pi, p, d, X0=None):
+
+    alpha_weights = p['alpha'].reshape(p['N'] * p['J'])  # (J*N,)
 
     # Pre-tax Income vector
     VAn = np.sum(d['VAnj'] * w_hat.T, axis=0)  # (N,)
@@ -62,7 +164,15 @@ def EX(w_hat, pi, p, d):
     In_vec = np.tile(In_pre, (p['J'], 1)).flatten() * alpha_weights  # (J*N,)
 
     # Solve for output
-    X = np.linalg.solve(Leonteiff, In_vec)  # (J*N,)
+    solver = p.get('ex_solver', 'dense')
+    if solver == 'dense':
+        X = _solve_dense(pi, In_vec, p, d)
+    elif solver == 'woodbury':
+        X = _solve_woodbury(pi, In_vec, p, d)
+    elif solver == 'krylov':
+        X = _solve_krylov(pi, In_vec, p, d, X0)
+    else:
+        raise ValueError(f"Unknown EX solver: {solver}")
     X = X.reshape((p['N'], p['J']), order='F').T  # (J, N)
 
     # Bilateral expenditure matrix
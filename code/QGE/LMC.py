@@ -1,7 +1,7 @@
 import numpy as np
 
 
-def LMC(w_hat, Expenditure, GO, p, d):
+def LMC(w_hat, Expenditure, GO, p, d, v=None):
 
     VAnj = p['B'] * GO  # Element-wise multiply, broadcasting over rows
 
@@ -9,6 +9,29 @@ def LMC(w_hat, Expenditure, GO, p, d):
     Z = -(np.sum(Expenditure, axis=0).T - np.sum(GO, axis=0).T -
           p['D']) / np.sum(d['VAnj'], axis=0).T
 
-    w_hat = np.multiply(w_hat, (1 + p['v']*np.divide(Z, w_hat)))
+    v = p['v'] if v is None else v
+    w_hat = np.multiply(w_hat, (1 + v*np.divide(Z, w_hat)))
 
     return w_hat, VAnj, Z
+
+
+def adapt_damping(v, Z, Z_prev, p):
+    # Next LMC step size from the trend in the excess-demand residual:
+    # shrink on oscillation or growth, expand on slow monotone progress
+    Z_err, Z_err_prev = np.sum(np.abs(Z)), np.sum(np.abs(Z_prev))
+    cos = np.dot(Z, Z_prev) / max(np.linalg.norm(Z) *
+                                  np.linalg.norm(Z_prev), 1e-300)
+    ratio = Z_err / max(Z_err_prev, 1e-300)
+
+    if cos < 0 and ratio > 0.5:
+        v, trend = v * 0.5, 'oscillation'
+    elif ratio > 1:
+        v, trend = v * 0.7, 'growth'
+    elif ratio > 0.8 and cos > 0.9:
+        v, trend = v * 1.5, 'stall'
+    elif ratio > 0.3:
+        v, trend = v * 1.1, 'progress'
+    else:
+        trend = 'fast'
+
+    return min(max(v, p.get('v_min', 0.05)), p.get('v_max', 5.0)), trend
@@ -1,16 +1,23 @@
 import numpy as np
 
 
-def TS(c_hat, P_hat, d, p):
-    pi_hat = np.empty((p['N'], p['N'], p['J']))
+def TS(c_hat, P_hat, d, p, ws=None):
+    theta = p['theta']                          # (J,)
+    P_theta = (P_hat ** theta[:, None]).T       # (N, J)
 
-    for j in range(p['J']):
-        c_j = c_hat[j, :]                   # shape: (N,)
-        tau_j = d['tau_hat'][:, :, j]       # shape: (N, N)
-        P_j = P_hat[j, :]                   # shape: (N,)
+    if ws is not None and ws.get('pni_c_hat') is c_hat:
+        # EP left d['pi'] * (c_hat * tau_hat) ** (-theta) for this c_hat in
+        # its work array: scale it in place by P_hat ** theta and take it
+        # over, so pi_hat itself is never formed
+        pi = ws.pop('pni_hat')
+        pi *= P_theta[:, None, :]
+        return pi, None
 
-        pi_hat[:, :, j] = ((c_j[None, :] * tau_j) /
-                           P_j[:, None]) ** (-p['theta'][j])
+    # (c_j * tau_j / P_j) ** (-theta_j) over all sectors at once
+    pi_hat = np.log(d['tau_hat']) + np.log(c_hat).T[None, :, :]  # (N, N, J)
+    pi_hat *= -theta
+    np.exp(pi_hat, out=pi_hat)
+    pi_hat *= P_theta[:, None, :]
 
     # Update trade shares
     pi = d['pi'] * pi_hat  # elementwise multiply
@@ -0,0 +1,309 @@
+import time
+
+import numpy as np
+from QGE.equilibrium import _Telemetry
+from QGE.profiling import stage
+
+
+# Scenario-stacked versions of EP, TS, EX and LMC. Every array carries the
+# scenario along a leading axis: w_hat (S, N), P_hat (S, J, N),
+# tau_hat (S, N, N, J). Baseline shares, parameters and d['tau'] are shared.
+
+# Bytes of dense Leontief matrices built per chunk of the stacked dense EX
+# solve (np.linalg.solve works on a copy, so each matrix counts twice)
+BATCH_MEMORY = 256 << 20
+
+# Solver options of equilibrium() that the batch does not implement
+UNSUPPORTED = ('eq_solver', 'lmc_adaptive', 'inexact', 'ep_anderson',
+               'continuation')
+
+
+def _prices(w_hat, P_hat, ltau_theta, d, p):
+    # Price fixed point for all scenarios. Scenarios drop out of the sweep
+    # once they converge, as EP would stop for each of them alone. Returns
+    # pni = d['pi'] * (c_hat * tau_hat) ** (-theta) for the final c_hat,
+    # which the trade-share step scales by P_hat ** theta.
+    S = len(w_hat)
+    theta = p['theta']                                 # (J,)
+    lw_hat_term = np.log(w_hat)[:, None, :] * p['B']   # (S, J, N)
+    lP_hat = np.log(P_hat)                             # (S, J, N)
+    P_hat = P_hat.copy()
+    lc_hat = np.empty(P_hat.shape)                     # (S, J, N)
+    pni = np.empty(ltau_theta.shape)                   # (S, N, N, J)
+    buf = np.empty(ltau_theta.shape)                   # sweep work array
+    it = np.zeros(S, dtype=int)
+
+    active = np.arange(S)
+    sub_ltau_theta = ltau_theta
+    k = 1
+    while active.size:
+        lc = np.einsum('anj,san->sjn', p['G'], lP_hat[active])
+        lc += lw_hat_term[active]                      # (S_a, J, N)
+        lc_hat[active] = lc
+
+        lc_theta = np.swapaxes(lc, 1, 2) * -theta      # (S_a, N, J)
+        pn = np.add(sub_ltau_theta, lc_theta[:, None, :, :],
+                    out=buf[:active.size])
+        np.exp(pn, out=pn)
+        pn *= d['pi']                                  # (S_a, N, N, J)
+
+        lP_hat1 = np.log(np.sum(pn, axis=2))           # (S_a, N, J)
+        lP_hat1 = np.swapaxes(lP_hat1, 1, 2) / -theta[:, None]
+        P_hat1 = np.exp(lP_hat1)
+
+        P_err = np.max(np.abs(P_hat1 - P_hat[active]), axis=(1, 2))
+        P_hat[active] = P_hat1
+        lP_hat[active] = lP_hat1
+        it[active] += 1
+        k += 1
+
+        done = P_err <= p['tol']
+        if k >= p['maxit']:
+            done[:] = True
+        if np.any(done):
+            pni[active[done]] = pn[done]
+            active = active[~done]
+            sub_ltau_theta = ltau_theta[active]
+
+    c_hat = np.exp(lc_hat)
+    Pn_hat = np.prod(P_hat ** p['alpha'], axis=1)      # (S, N)
+    return P_hat, c_hat, Pn_hat, pni, it
+
+
+def _trade_shares(pni, P_hat, p):
+    P_theta = np.swapaxes(P_hat ** p['theta'][:, None], 1, 2)  # (S, N, J)
+    pni *= P_theta[:, :, None, :]
+    return pni
+
+
+def _leontief_stack(share, r, p):
+    # Dense I - M - Rt for every scenario, in the X layout used by EX:
+    # row (a, i), column (j, n) at a*N + i and j*N + n
+    N, J = p['N'], p['J']
+    S = share.shape[0]
+    A = np.einsum('aij,snij->saijn', p['G'], share)     # (S, J, N, J, N)
+    A *= -1
+    idx = np.arange(N)
+    A[:, :, idx, :, idx] -= np.einsum('ai,sij->isaj', p['alpha'], r)
+    A = A.reshape((S, N * J, N * J))
+    A[:, np.arange(N * J), np.arange(N * J)] += 1
+    return A
+
+
+def _gmres(matvec, b, x0, rtol, maxiter, restart=20):
+    # Restarted GMRES run independently for each row of b (S, n), sharing
+    # one batched matvec per Krylov step. Each row builds its own Krylov
+    # basis, so it converges as a standalone solve would.
+    S = b.shape[0]
+    x = x0.copy()
+    b_norm = np.linalg.norm(b, axis=1)
+    e1 = np.zeros((S, restart + 1))
+    V = np.empty((S, restart + 1, b.shape[1]))
+    H = np.zeros((S, restart + 1, restart))
+
+    its = 0
+    while its < maxiter:
+        r = b - matvec(x)
+        beta = np.linalg.norm(r, axis=1)
+        if np.all(beta <= rtol * b_norm):
+            return x, 0
+        V[:, 0] = r / np.maximum(beta, 1e-300)[:, None]
+        H[...] = 0
+        e1[:, 0] = beta
+
+        for k in range(restart):
+            w = matvec(V[:, k])
+            # Classical Gram-Schmidt with reorthogonalization
+            for _ in range(2):
+                h = np.einsum('skn,sn->sk', V[:, :k + 1], w)
+                w -= np.einsum('sk,skn->sn', h, V[:, :k + 1])
+                H[:, :k + 1, k] += h
+            H[:, k + 1, k] = np.linalg.norm(w, axis=1)
+            V[:, k + 1] = w / np.maximum(H[:, k + 1, k], 1e-300)[:, None]
+            its += 1
+
+            # Residual of the least-squares problem min |beta e1 - H y|
+            Q, R = np.linalg.qr(H[:, :k + 2, :k + 1], mode='complete')
+            g = np.einsum('sji,sj->si', Q, e1[:, :k + 2])
+            if np.all(np.abs(g[:, k + 1]) <= rtol * b_norm) or \
+                    its >= maxiter:
+                break
+
+        y = np.linalg.solve(R[:, :k + 1, :k + 1], g[:, :k + 1, None])
+        x += np.einsum('skn,sk->sn', V[:, :k + 1], y[:, :, 0])
+
+    r = b - matvec(x)
+    return x, int(np.any(np.linalg.norm(r, axis=1) > rtol * b_norm))
+
+
+def _solve_output(share, r, In_vec, X0, p):
+    # Output for all scenarios: stacked dense solves in chunks of
+    # p['batch_chunk'] scenarios (by default as many as fit
+    # p['batch_memory'] bytes), or one GMRES solve of the block-diagonal
+    # system warm-started from the previous iterate
+    N, J = p['N'], p['J']
+    S = share.shape[0]
+    solver = p.get('ex_solver', 'dense')
+
+    if solver == 'dense':
+        matrix_bytes = 2 * 8 * (N * J) ** 2
+        chunk = int(p.get('batch_chunk', max(
+            1, p.get('batch_memory', BATCH_MEMORY) // matrix_bytes)))
+        X = np.empty((S, N * J))
+        for k in range(0, S, chunk):
+            with stage(p, 'EX.assemble'):
+                A = _leontief_stack(share[k:k + chunk], r[k:k + chunk], p)
+            with stage(p, 'EX.solve'):
+                X[k:k + chunk] = np.linalg.solve(
+                    A, In_vec[k:k + chunk, :, None])[:, :, 0]
+        return X.reshape((S, J, N))
+
+    if solver == 'krylov':
+        # Contiguous layouts that turn both contractions into batched
+        # matrix-vector products
+        share_T = np.ascontiguousarray(
+            np.transpose(share, (0, 3, 2, 1)))                   # (S, J, N, N)
+        G_T = np.ascontiguousarray(np.transpose(p['G'], (1, 0, 2)))  # (N, J, J)
+
+        def matvec(x):
+            X = x.reshape((S, J, N))
+            GO = np.matmul(share_T, X[..., None])[..., 0]          # (S, J, N)
+            MX = np.matmul(G_T, np.swapaxes(GO, 1, 2)[..., None])  # (S, N, J, 1)
+            RtX = p['alpha'] * np.einsum('snj,sjn->sn', r, X)[:, None, :]
+            return (X - np.swapaxes(MX[..., 0], 1, 2) - RtX).reshape(
+                (S, J * N))
+
+        with stage(p, 'EX.solve'):
+            x, info = _gmres(matvec, In_vec, X0.reshape((S, J * N)),
+                             rtol=p.get('ex_tol', 1e-12),
+                             maxiter=int(p.get('ex_maxit', 1_000)))
+        if info != 0:
+            raise RuntimeError(
+                f"Batched EX gmres solve did not converge (info = {info})")
+        return x.reshape((S, J, N))
+
+    raise ValueError(f"Unknown batched EX solver: {solver}")
+
+
+def _expenditure(w_hat, pi, taup, X0, d, p):
+    N = p['N']
+
+    # Pre-tax income and its split over sectors
+    VAn = np.sum(d['VAnj'][None, :, :] * w_hat[:, None, :], axis=1)  # (S, N)
+    In_pre = VAn + p['D']                                            # (S, N)
+    In_vec = (p['alpha'][None, :, :] * In_pre[:, None, :]).reshape(
+        (len(w_hat), -1))                                            # (S, J*N)
+
+    share = pi / taup                                      # (S, N, N, J)
+    r = np.sum(pi * (taup - 1) / taup, axis=2)             # (S, N, J)
+    X = _solve_output(share, r, In_vec, X0, p)             # (S, J, N)
+
+    # Bilateral expenditure, production and spending
+    xbilat = share * np.swapaxes(X, 1, 2)[:, :, None, :]   # (S, N, N, J)
+    GO = np.swapaxes(np.sum(xbilat, axis=1), 1, 2)         # (S, J, N)
+    Expenditure = np.swapaxes(np.sum(xbilat, axis=2), 1, 2)
+
+    # Trade flows exclude domestic purchases
+    home = np.swapaxes(xbilat[:, np.arange(N), np.arange(N), :], 1, 2)
+    Ex = GO - home
+    Im = Expenditure - home
+
+    # Post-tax income
+    In = In_pre + np.sum(xbilat * (taup - 1) / taup, axis=(2, 3))
+
+    return X, xbilat, In, GO, Expenditure, Im, Ex
+
+
+def _labor_market(w_hat, Expenditure, GO, d, p):
+    VAnj = p['B'] * GO
+    Z = -(np.sum(Expenditure, axis=1) - np.sum(GO, axis=1) -
+          p['D']) / np.sum(d['VAnj'], axis=0)               # (S, N)
+    w_hat = w_hat * (1 + p['v'] * Z / w_hat)
+    return w_hat, VAnj, Z
+
+
+def equilibrium_batch(d, p, tau_hat, callback=None):
+    # Damped Picard equilibrium for S tariff scenarios at once, tau_hat of
+    # shape (S, N, N, J). Scenarios leave the batch as they converge, so
+    # each stops at the same criterion as equilibrium(d, p) would apply.
+    # Options selecting another solver (UNSUPPORTED) raise ValueError.
+    for key in UNSUPPORTED:
+        if p.get(key) and not (key == 'eq_solver' and p[key] == 'picard'):
+            raise ValueError(f"Batch equilibrium does not support {key}")
+
+    S = tau_hat.shape[0]
+    maxit = int(p.get('maxit', 10_000))
+    telemetry = _Telemetry(callback)
+
+    taup = tau_hat * d['tau']
+    ltau_theta = np.log(tau_hat) * -p['theta']
+
+    out = {
+        'w_hat': np.tile(d['w_hat0'], (S, 1)),
+        'P_hat': np.tile(d['P_hat0'], (S, 1, 1)),
+        'X': np.tile(d['X'], (S, 1, 1)),
+    }
+    it = np.zeros(S, dtype=int)
+    ep_it = np.zeros(S, dtype=int)
+    Z_err = np.full(S, np.inf)
+
+    active = np.arange(S)
+    sub_taup = taup
+    sub_ltau_theta = ltau_theta
+    k = 0
+    while active.size and k < maxit:
+        if active.size < len(sub_taup):
+            # Restrict the scenario-specific inputs to unconverged scenarios
+            sub_taup = taup[active]
+            sub_ltau_theta = ltau_theta[active]
+
+        step_time = {}
+        start = time.perf_counter()
+        with stage(p, 'EP'):
+            P_hat, c_hat, Pn_hat, pni, sweeps = _prices(
+                out['w_hat'][active], out['P_hat'][active], sub_ltau_theta,
+                d, p)
+        step_time['EP'] = time.perf_counter() - start
+        start = time.perf_counter()
+        with stage(p, 'TS'):
+            pi = _trade_shares(pni, P_hat, p)
+        step_time['TS'] = time.perf_counter() - start
+        start = time.perf_counter()
+        with stage(p, 'EX'):
+            X, xbilat, In, GO, Expenditure, Im, Ex = _expenditure(
+                out['w_hat'][active], pi, sub_taup, out['X'][active], d, p)
+        step_time['EX'] = time.perf_counter() - start
+        start = time.perf_counter()
+        with stage(p, 'LMC'):
+            w_hat, VAnj, Z = _labor_market(
+                out['w_hat'][active], Expenditure, GO, d, p)
+        step_time['LMC'] = time.perf_counter() - start
+
+        step = {'w_hat': w_hat, 'P_hat': P_hat, 'Pn_hat': Pn_hat, 'X': X,
+                'pi': pi, 'xbilat': xbilat, 'In': In, 'GO': GO,
+                'Expenditure': Expenditure, 'Im': Im, 'Ex': Ex,
+                'VAnj': VAnj}
+        for key, value in step.items():
+            if key not in out or out[key].shape[1:] != value.shape[1:]:
+                out[key] = np.zeros((S,) + value.shape[1:])
+            out[key][active] = value
+
+        Z_err[active] = np.sum(np.abs(Z), axis=1)
+        it[active] += 1
+        ep_it[active] += sweeps
+        k += 1
+
+        telemetry.add({'ep_it': int(np.sum(sweeps)), 'time': step_time})
+        telemetry.emit(k, np.max(Z_err[active]), active=int(active.size))
+
+        active = active[Z_err[active] > p['tol']]
+
+    if active.size:
+        raise RuntimeError(
+            f"Scenarios {active.tolist()} did not converge within {maxit} "
+            f"iterations. Last tolerance: {np.max(Z_err[active])}"
+        )
+
+    out.update({'it': it, 'ep_it': ep_it, 'D': p['D'],
+                'telemetry': telemetry.records})
+    return out
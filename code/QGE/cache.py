@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+
+def _update(h, value):
+    # Feed a canonical encoding of nested dicts, sequences, arrays and
+    # scalars to the hash: dict keys sorted, arrays by dtype, shape and
+    # C-order bytes, anything else by type and repr
+    if isinstance(value, dict):
+        h.update(b'{')
+        for key in sorted(value, key=repr):
+            h.update(repr(key).encode())
+            _update(h, value[key])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for item in value:
+            _update(h, item)
+        h.update(b']')
+    elif isinstance(value, np.ndarray):
+        h.update(f'{value.dtype.str}{value.shape}'.encode())
+        if value.dtype == object:
+            _update(h, value.tolist())
+        else:
+            h.update(np.ascontiguousarray(value).data)
+    elif hasattr(value, 'to_numpy'):
+        # pandas objects (country and sector labels)
+        h.update(f'{type(value).__name__}{getattr(value, "name", None)!r}'.encode())
+        _update(h, value.to_numpy())
+    else:
+        h.update(f'{type(value).__name__}:{value!r}'.encode())
+
+
+def digest(*values):
+    h = hashlib.sha256()
+    for value in values:
+        _update(h, value)
+    return h.hexdigest()
+
+
+class ResultCache:
+    # Content-addressed cache of solved counterfactuals on disk: one pickle
+    # per key under path. Hits refresh the file's modification time, and
+    # writes evict the least recently used files until the cache fits in
+    # max_bytes. Files are written to a temporary name and renamed, so
+    # processes can share a cache directory.
+    SUFFIX = '.pkl'
+
+    def __init__(self, path, max_bytes=1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.SUFFIX)
+
+    def get(self, key):
+        # The cached result, or None on a miss. A file that cannot be read
+        # or unpickled (e.g. left truncated by an interrupted write) is a
+        # miss and is removed.
+        try:
+            with open(self._file(key), 'rb') as f:
+                result = pickle.load(f)
+            os.utime(self._file(key))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (pickle.UnpicklingError, EOFError, OSError):
+            self.misses += 1
+            try:
+                os.unlink(self._file(key))
+            except OSError:
+                pass
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict(keep=key)
+
+    def _entries(self):
+        # (mtime, size, file) of the cached results
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not entry.name.endswith(self.SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, keep=None):
+        # Remove least recently used results until the cache fits; the
+        # result just written (keep) stays even if it alone is too large
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            if keep is not None and path == self._file(keep):
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(entry[1] for entry in entries),
+            'max_bytes': self.max_bytes,
+        }
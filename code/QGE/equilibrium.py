@@ -2,58 +2,130 @@ import pandas as pd
 import numpy as np
 from scipy.sparse import eye, kron
 from scipy.linalg import null_space
+from scipy.sparse.linalg import LinearOperator, gmres
 import os
 import sys
+import time
 if __name__ == "__main__":
     sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
     from QGE.EP import EP
     from QGE.TS import TS
     from QGE.EX import EX
-    from QGE.LMC import LMC
+    from QGE.LMC import LMC, adapt_damping
+    from QGE.profiling import stage
+    from QGE.warm import SolutionStore, apply_seed
 else:
     from QGE.EP import EP
     from QGE.TS import TS
     from QGE.EX import EX
-    from QGE.LMC import LMC
+    from QGE.LMC import LMC, adapt_damping
+    from QGE.profiling import stage
+    from QGE.warm import SolutionStore, apply_seed
 
 
-def equilibrium(d, p):
-    it = 0
-    maxit = int(p.get('maxit', 10_000))
-    # Initialize model variables
-    w_hat = d['w_hat0'].copy()     # (N, 1)
-    P_hat = d['P_hat0'].copy()     # (J, N)
-    X = d['X']                     # (J, N)
-    pi = d['pi']                   # (N, N, J)
-    D = p['D']                     # (N,)
-    Z_err = 1
-    while Z_err > p['tol'] and it < maxit:
+STAGES = ('EP', 'TS', 'EX', 'LMC')
 
-        # Prices
-        [P_hat, c_hat, Pn_hat] = EP(w_hat, P_hat, d, p)
+# EP counts of accelerated price sweeps and of Anderson history restarts
+ANDERSON = ('anderson_steps', 'anderson_restarts')
 
-        # Trade shares
-        [pi, pi_hat] = TS(c_hat, P_hat, d, p)
 
-        # Expenditures
-        [X, xbilat, In, GO, Expenditure, Im, Ex] = EX(w_hat, pi, p, d)
+def print_progress(record):
+    # Telemetry consumer reproducing the solver's console log
+    print('Tolerance = ', record['Z_err'])
 
-        # LMC
-        [w_hat, VAnj, Z] = LMC(w_hat, Expenditure, GO, p, d)
 
-        Z_err = sum(abs(Z))
-        print('Tolerance = ', Z_err)
+class _Telemetry:
+    # Per-iteration records of the residual, inner sweeps (with their
+    # Anderson steps and restarts) and stage wall time, forwarded to an
+    # optional callback as they are produced
 
-        it += 1
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.records = []
+        self.extra = {}
+        self.start = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self.ep_it = 0
+        self.anderson = dict.fromkeys(ANDERSON, 0)
+        self.evals = 0
+        self.time = dict.fromkeys(STAGES, 0.0)
+
+    def add(self, step):
+        self.ep_it += step['ep_it']
+        for key in ANDERSON:
+            self.anderson[key] += step.get(key, 0)
+        self.evals += 1
+        for name, seconds in step['time'].items():
+            self.time[name] += seconds
+
+    def emit(self, it, Z_err, **extra):
+        record = {'it': it, 'Z_err': float(Z_err), 'ep_it': self.ep_it,
+                  **self.anderson, 'evals': self.evals, 'time': self.time,
+                  'elapsed': time.monotonic() - self.start, **self.extra,
+                  **extra}
+        self.records.append(record)
+        self._reset()
+        if self.callback is not None:
+            self.callback(record)
+
+
+class _Interrupt:
+    # Cooperative stop check shared by the outer and inner loops: true once
+    # the wall-clock budget (seconds) runs out or the cancel token is set.
+    # Any object with is_set(), e.g. threading.Event, works as a token.
+
+    def __init__(self, budget=None, cancel=None):
+        self.deadline = None if budget is None else time.monotonic() + budget
+        self.cancel = cancel
+        self.status = None
+
+    def __call__(self):
+        if self.status is None:
+            if self.cancel is not None and self.cancel.is_set():
+                self.status = 'cancelled'
+            elif self.deadline is not None and \
+                    time.monotonic() >= self.deadline:
+                self.status = 'timeout'
+        return self.status is not None
+
+
+class _Interrupted(Exception):
+    def __init__(self, step):
+        super().__init__()
+        self.step = step
 
-    if Z_err > p['tol']:
-        raise RuntimeError(
-            f"Equilibrium did not converge within {maxit} iterations. Last tolerance: {Z_err}"
-        )
 
-    print('Equilibrium converged')
+def _step(w_hat, P_hat, X, d, p, ws, ep_info, v=None):
+    # One pass through prices, trade shares, expenditures and labor markets
+    stage_time = {}
+    start = time.perf_counter()
 
-    output = {
+    # Prices
+    with stage(p, 'EP'):
+        [P_hat, c_hat, Pn_hat] = EP(w_hat, P_hat, d, p, ws=ws, info=ep_info)
+    stage_time['EP'] = time.perf_counter() - start
+    start = time.perf_counter()
+
+    # Trade shares
+    with stage(p, 'TS'):
+        [pi, pi_hat] = TS(c_hat, P_hat, d, p, ws=ws)
+    stage_time['TS'] = time.perf_counter() - start
+    start = time.perf_counter()
+
+    # Expenditures
+    with stage(p, 'EX'):
+        [X, xbilat, In, GO, Expenditure, Im, Ex] = EX(w_hat, pi, p, d, X0=X)
+    stage_time['EX'] = time.perf_counter() - start
+    start = time.perf_counter()
+
+    # LMC
+    with stage(p, 'LMC'):
+        [w_hat, VAnj, Z] = LMC(w_hat, Expenditure, GO, p, d, v=v)
+    stage_time['LMC'] = time.perf_counter() - start
+
+    return {
         'X': X,
         'pi': pi,
         'VAnj': VAnj,
@@ -66,10 +138,298 @@ def equilibrium(d, p):
         'Expenditure': Expenditure,
         'Im': Im,
         'Ex': Ex,
-        'D': D,
-        'it': it
+        'Z': Z,
+        'ep_it': ep_info['it'],
+        'anderson_steps': ep_info['anderson_steps'],
+        'anderson_restarts': ep_info['anderson_restarts'],
+        'time': stage_time,
     }
 
-    # Reorder to 'baseline' keys to match 'd' do it manually
+
+def _picard(d, p, telemetry, maxit=None):
+    # maxit caps the outer iterations (p['maxit'] by default; p['maxit']
+    # also caps the inner price sweeps)
+    it = 0
+    maxit = int(p.get('maxit', 10_000)) if maxit is None else maxit
+    # Initialize model variables
+    w_hat = d['w_hat0'].copy()     # (N, 1)
+    P_hat = d['P_hat0'].copy()     # (J, N)
+    X = d.get('X0', d['X'])        # (J, N), output seeding the EX solve
+    ws = {}                        # Work arrays reused across iterations
+    ep_info = {}
+    ep_it = 0                      # Total inner price sweeps
+    anderson = dict.fromkeys(ANDERSON, 0)
+    adaptive = p.get('lmc_adaptive', False)
+    v = p['v']                     # LMC step size
+    steps = []                     # Step size used on each iteration
+    Z_prev = None
+    Z_err = 1
+    inner_tol = p['tol']
+    interrupt = p.get('_interrupt')
+    status = 'converged'
+    while (Z_err > p['tol'] or inner_tol > p['tol']) and it < maxit:
+
+        # Inexact mode: loose price and output solves while the wage residual
+        # is large, tightened to p['tol'] as it falls
+        p_inner = p
+        if p.get('inexact', False):
+            inner_tol = max(p['tol'], min(p.get('inexact_max_tol', 1e-3),
+                                          p.get('inexact_eta', 0.01) * Z_err))
+            p_inner = dict(p, tol=inner_tol,
+                           ex_tol=max(p.get('ex_tol', 1e-12), inner_tol))
+
+        # Damped wage update after a full EP/TS/EX/LMC pass
+        output = _step(w_hat, P_hat, X, d, p_inner, ws, ep_info, v=v)
+        w_hat, P_hat, X = output['w_hat'], output['P_hat'], output['X']
+        ep_it += ep_info['it']
+        for key in ANDERSON:
+            anderson[key] += ep_info[key]
+        steps.append(v)
+
+        Z_err = sum(abs(output['Z']))
+        telemetry.add(output)
+        telemetry.emit(it + 1, Z_err, v=v)
+        if not np.isfinite(Z_err):
+            raise RuntimeError(
+                f"Equilibrium diverged after {it + 1} iterations")
+
+        if adaptive and Z_prev is not None:
+            v, _ = adapt_damping(v, output['Z'], Z_prev, p)
+        Z_prev = output['Z']
+
+        it += 1
+
+        if interrupt is not None and interrupt():
+            status = interrupt.status
+            break
+
+    if status == 'converged' and Z_err > p['tol']:
+        raise RuntimeError(
+            f"Equilibrium did not converge within {maxit} iterations. Last tolerance: {Z_err}"
+        )
+
+    output.update({'it': it, 'evals': it, 'ep_it': ep_it, **anderson,
+                   'v': np.array(steps), 'status': status})
+
+    return output
+
+
+def _newton_krylov(d, p, telemetry, maxit=None):
+    # Solve Z(w_hat) = 0 in log wages with Jacobian-free Newton-Krylov.
+    # Each residual evaluation is a full EP/TS/EX/LMC pass warm-started from
+    # the prices and output at the current iterate; Jacobian-vector products
+    # are forward differences of Z, and steps are capped and backtracked.
+    N = p['N']
+    maxit = int(p.get('maxit', 10_000)) if maxit is None else maxit
+    max_step = p.get('nk_max_step', 0.5)
+    interrupt = p.get('_interrupt')
+    # Finite-difference Jacobian products need price fixed points well below
+    # the difference step, whatever the outer tolerance
+    p_inner = dict(p, tol=min(p['tol'], p.get('nk_inner_tol', 1e-10)))
+    ws = {}
+    ep_info = {}
+    evals = 0
+    ep_it = 0
+    anderson = dict.fromkeys(ANDERSON, 0)
+
+    # Walras' law makes Z(w_hat) singular in one direction. The damped LMC
+    # update keeps world value added sum(VAn * w_hat) fixed, so impose the
+    # same normalization: F = Z - (a'w_hat - a'w_hat0), a = VAn / sum(VAn).
+    a = np.sum(d['VAnj'], axis=0)
+    a = a / np.sum(a)
+    level = a @ d['w_hat0']
+
+    def evaluate(lw_hat):
+        nonlocal evals, ep_it
+        with np.errstate(all='ignore'):
+            step = _step(np.exp(lw_hat), current['P_hat'], current['X'], d,
+                         p_inner, ws, ep_info)
+        step['F'] = step['Z'] - (a @ np.exp(lw_hat) - level)
+        evals += 1
+        ep_it += ep_info['it']
+        for key in ANDERSON:
+            anderson[key] += ep_info[key]
+        telemetry.add(step)
+        if interrupt is not None and interrupt():
+            raise _Interrupted(step)
+        return step
+
+    lw_hat = np.log(d['w_hat0'])
+    current = {'P_hat': d['P_hat0'].copy(), 'X': d.get('X0', d['X'])}
+    it = 0
+    status = 'converged'
+    try:
+        current = evaluate(lw_hat)
+        Z_err = sum(abs(current['F']))
+        telemetry.emit(0, Z_err)
+
+        eta = 0.5
+        while Z_err > p['tol'] and it < maxit:
+            F = current['F']
+
+            def jvp(v):
+                v_norm = np.linalg.norm(v)
+                if v_norm == 0:
+                    return np.zeros(N)
+                eps = 1e-6 * \
+                    max(1.0, np.linalg.norm(lw_hat)) / v_norm
+                return (evaluate(lw_hat + eps * v)['F'] - F) / eps
+
+            # Inexact Newton direction: J du = -F to relative tolerance eta
+            du, _ = gmres(LinearOperator((N, N), matvec=jvp, dtype=float),
+                          -F, rtol=eta, atol=0.0, restart=N, maxiter=1)
+
+            # Cap the step in log wages, then backtrack on the residual norm
+            lam = min(1.0, max_step / max(np.max(np.abs(du)), 1e-300))
+            while True:
+                trial = evaluate(lw_hat + lam * du)
+                trial_err = sum(abs(trial['F']))
+                if np.isfinite(trial_err) and \
+                        trial_err < (1 - 1e-4 * lam) * Z_err:
+                    break
+                lam /= 2
+                if lam < 1e-4:
+                    # No descent along du: fall back to a damped LMC step
+                    trial = evaluate(np.log(current['w_hat']))
+                    trial_err = sum(abs(trial['F']))
+                    du, lam = np.log(current['w_hat']) - lw_hat, 1.0
+                    break
+
+            lw_hat = lw_hat + lam * du
+            eta = min(0.5, 0.9 * (trial_err / Z_err) ** 2)
+            current, Z_err = trial, trial_err
+
+            it += 1
+            telemetry.emit(it, Z_err, step=lam)
+
+    except _Interrupted as exc:
+        # Return the last accepted iterate, or the interrupted first pass
+        status = interrupt.status
+        if 'F' not in current:
+            current = exc.step
+        Z_err = sum(abs(current['F']))
+        telemetry.emit(it, Z_err)
+
+    if status == 'converged' and Z_err > p['tol']:
+        raise RuntimeError(
+            f"Equilibrium did not converge within {maxit} Newton iterations. "
+            f"Last tolerance: {Z_err}"
+        )
+
+    # Report wages at the solution rather than the LMC-updated ones
+    current['w_hat'] = np.exp(lw_hat)
+    del current['F']
+    current.update({'it': it, 'evals': evals, 'ep_it': ep_it, **anderson,
+                    'status': status})
+    return current
+
+
+def _continuation(d, p, solve, telemetry):
+    # Homotopy in log tariffs for large shocks: solve tau_hat ** s on steps
+    # 0 < s_1 < ... < 1 from the baseline (s = 0), each seeded by the secant
+    # through the last two solutions (QGE.warm). A step solved within
+    # cont_fast iterations lengthens the next by cont_grow and one taking
+    # over cont_slow shortens it; one that fails within cont_maxit (or
+    # diverges) is retried at half the length, down to cont_min_step. Steps
+    # stop at cont_tol; when that is looser than tol, s = 1 is then polished
+    # to tol. Telemetry records carry s, with it counted per step. The
+    # cont_maxit cap applies to the outer iterations only; p['maxit'] still
+    # bounds the inner price sweeps.
+    tol = p['tol']
+    step_maxit = min(int(p.get('maxit', 10_000)),
+                     int(p.get('cont_maxit', 200)))
+    fast = int(p.get('cont_fast', step_maxit // 20))
+    slow = int(p.get('cont_slow', step_maxit // 4))
+    grow = p.get('cont_grow', 2.0)
+    min_step = p.get('cont_min_step', 1e-3)
+    p_step = dict(p, tol=max(tol, p.get('cont_tol', tol)))
+
+    ltau_hat = np.log(d['tau_hat'])
+    base = (np.ones_like(ltau_hat), {'w_hat': d['w_hat0'],
+                                     'P_hat': d['P_hat0'],
+                                     'X': d.get('X0', d['X'])})
+    store = SolutionStore(size=2)
+    totals = dict.fromkeys(('it', 'evals', 'ep_it') + ANDERSON, 0)
+    steps = []
+
+    def attempt(s, p_s, maxit):
+        tau_hat = np.exp(s * ltau_hat)
+        d_s = dict(d, tau_hat=tau_hat, taup=tau_hat * d['tau'])
+        prediction = store.predict(tau_hat, base)
+        if prediction is not None:
+            apply_seed(d_s, prediction[1])
+        telemetry.extra = {'s': s}
+        try:
+            with np.errstate(all='ignore'):
+                output = solve(d_s, p_s, telemetry, maxit=maxit)
+        except RuntimeError:
+            output = None
+        if output is not None:
+            for key in totals:
+                totals[key] += output[key]
+        converged = output is not None and \
+            np.all(np.isfinite(output['w_hat']))
+        steps.append({'s': s, 'it': None if output is None else output['it'],
+                      'converged': bool(converged)})
+        if converged and output['status'] == 'converged':
+            store.add(tau_hat, output)
+        return output if converged else None
+
+    s, h = 0.0, p.get('cont_step', 0.1)
+    while s < 1.0:
+        s_try = min(1.0, s + h)
+        output = attempt(s_try, p_step, step_maxit)
+        if output is None:
+            h /= 2
+            if h < min_step:
+                telemetry.extra = {}
+                raise RuntimeError(
+                    f"Continuation stalled at s = {s}, step {2 * h}")
+            continue
+        if output['status'] != 'converged':
+            break                 # Interrupted: the partial solve at s_try
+        s = s_try
+        if output['it'] <= fast:
+            h *= grow
+        elif output['it'] > slow:
+            h = max(h / grow, min_step)
+    else:
+        if p_step['tol'] > tol:
+            output = attempt(1.0, p, None)
+            if output is None:
+                telemetry.extra = {}
+                raise RuntimeError(
+                    "Equilibrium did not converge after continuation")
+
+    telemetry.extra = {}
+    output.update(totals)
+    output['continuation'] = steps
+    return output
+
+
+def equilibrium(d, p, solver=None, callback=None, budget=None, cancel=None):
+    # callback receives one telemetry record per outer iteration, e.g.
+    # print_progress; all records are also returned as output['telemetry'].
+    # With a time budget (seconds) or a cancel token the solve stops early
+    # and returns its last state with status 'timeout' or 'cancelled'.
+    telemetry = _Telemetry(callback)
+    if budget is not None or cancel is not None:
+        p = dict(p, _interrupt=_Interrupt(budget, cancel))
+    solver = solver or p.get('eq_solver', 'picard')
+    if solver == 'newton_krylov':
+        solve = _newton_krylov
+    elif solver == 'picard':
+        solve = _picard
+    else:
+        raise ValueError(f"Unknown equilibrium solver: {solver}")
+    if p.get('continuation', False):
+        output = _continuation(d, p, solve, telemetry)
+    else:
+        output = solve(d, p, telemetry)
+
+    output['D'] = p['D']
+    output['telemetry'] = telemetry.records
+    for key in ('Z', 'time'):
+        output.pop(key, None)
 
     return output
@@ -0,0 +1,216 @@
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+from QGE.EX import factorize_leontief
+
+
+# First-order approximation of the equilibrium around a solved point (the
+# calibrated baseline, or any converged counterfactual), from the implicit
+# function theorem applied to the EP/TS/EX/LMC system. In logs, for wage
+# and tariff changes dlw (N,) and dlt (N, N, J), with pi, X, ... at the
+# point:
+#   EP:  dlP = Pi (G' dlP + B dlw) + Pi dlt      (linearized CES price index)
+#   TS:  dlpi = -theta (dlc + dlt - dlP)
+#   EX:  (I - M - Rt) dX = dIn + (dM + dRt) X    (Leontief matrix at the point)
+#   LMC: dZ = -(sum_j dExpenditure - sum_j dGO) / VAn
+# Wages solve dZ = 0 under the normalization of the outer solvers (world
+# value added fixed), with the Jacobian dZ/dlw built column by column.
+# Welfare is In / In_baseline / Pn_hat, as on the results page.
+
+
+# Unit wage changes pushed through the chain together when building the
+# wage Jacobians
+CHUNK = 8
+
+
+def _solve(lu, rhs, trans=0):
+    # lu_solve over the trailing (J, N) axes of rhs, all leading ones at once
+    x = lu_solve(lu, rhs.reshape(-1, rhs.shape[-2] * rhs.shape[-1]).T,
+                 trans=trans)
+    return x.T.reshape(rhs.shape)
+
+
+def _chain(lin, dlw, dlt):
+    # First-order changes of the model variables for wage and tariff changes,
+    # dlw (..., N) and dlt (..., N, N, J), over any leading axes
+    p = lin['p']
+    N = p['N']
+    theta = p['theta']
+    pi, X0, S = lin['pi'], lin['X'], lin['S']
+
+    # Prices: one solve with the factorized (I - Pi G') matrix
+    lc_w = p['B'] * dlw[..., None, :]                         # (..., J, N)
+    rhs = np.einsum('nij,...ji->...jn', pi, lc_w) + \
+        np.einsum('nij,...nij->...jn', pi, dlt)
+    dlP = _solve(lin['K_lu'], rhs)
+    dlc = np.einsum('anj,...an->...jn', p['G'], dlP) + lc_w  # (..., J, N)
+
+    # Trade shares and the Leontief system
+    dlpi = np.swapaxes(dlc, -1, -2)[..., None, :, :] + dlt - \
+        np.swapaxes(dlP, -1, -2)[..., :, None, :]            # (..., N, N, J)
+    dlpi *= -theta
+    dS = S * (dlpi - dlt)
+    dr = np.sum(pi * (dlpi * lin['tax'] + dlt / lin['taup']), axis=-2)
+    dIn_pre = lin['VAn_w'] * dlw                              # (..., N)
+    dGO_X0 = np.einsum('...nij,jn->...ji', dS, X0)            # (..., J, N)
+    rhs = p['alpha'] * dIn_pre[..., None, :] + \
+        np.einsum('aij,...ji->...ai', p['G'], dGO_X0) + \
+        p['alpha'] * np.einsum('...nj,jn->...n', dr, X0)[..., None, :]
+    dX = _solve(lin['L_lu'], rhs)                             # (..., J, N)
+
+    # Flows and aggregates, as in EX
+    dxbilat = np.swapaxes(dX, -1, -2)[..., :, None, :] * S + \
+        X0.T[:, None, :] * dS                                 # (..., N, N, J)
+    dGO = np.swapaxes(np.sum(dxbilat, axis=-3), -1, -2)       # (..., J, N)
+    dExpenditure = np.swapaxes(np.sum(dxbilat, axis=-2), -1, -2)
+    own = np.swapaxes(dxbilat[..., np.arange(N), np.arange(N), :], -1, -2)
+    dR_t = np.sum(dxbilat * lin['tax'] + lin['xbilat'] * dlt / lin['taup'],
+                  axis=(-2, -1))
+    dIn = dIn_pre + dR_t
+    dZ = -(np.sum(dExpenditure, axis=-2) - np.sum(dGO, axis=-2)) / lin['VAn']
+
+    return {
+        'dlw': dlw, 'dlP': dlP, 'dlc': dlc, 'dX': dX, 'dxbilat': dxbilat,
+        'dGO': dGO, 'dExpenditure': dExpenditure, 'dEx': dGO - own,
+        'dIm': dExpenditure - own, 'dIn': dIn, 'dZ': dZ,
+        'dlW': dIn / lin['In'] - np.sum(p['alpha'] * dlP, axis=-2),
+    }
+
+
+def _chain_adjoint(lin, Z_bar, W_bar):
+    # Transpose of the tariff part of _chain (dlw = 0): the gradient with
+    # respect to dlt of Z_bar . dZ + W_bar . dlW, by running its steps
+    # backwards; the two solves use the same factors, transposed
+    p = lin['p']
+    theta = p['theta']
+    pi, X0, S, tax, taup = (lin[key] for key in
+                            ('pi', 'X', 'S', 'tax', 'taup'))
+
+    # Welfare and labor-market residual
+    In_bar = W_bar / lin['In']                                # (N,)
+    dlP_bar = -p['alpha'] * W_bar                             # (J, N)
+    Z_scaled = Z_bar / lin['VAn']                             # (N,)
+
+    # Flows: dIn = dR_t, dGO and dExpenditure sum dxbilat
+    dxbilat_bar = In_bar[:, None, None] * tax + \
+        Z_scaled[None, :, None] - Z_scaled[:, None, None]     # (N, N, J)
+    dlt_bar = In_bar[:, None, None] * lin['xbilat'] / taup
+
+    # Leontief system
+    dX_bar = np.sum(dxbilat_bar * S, axis=1).T                # (J, N)
+    dS_bar = dxbilat_bar * X0.T[:, None, :]
+    rhs_bar = _solve(lin['L_lu'], dX_bar, trans=1)
+    dGO_X0_bar = np.einsum('aij,ai->ji', p['G'], rhs_bar)     # (J, N)
+    dr_bar = X0.T * np.sum(p['alpha'] * rhs_bar, axis=0)[:, None]  # (N, J)
+    dS_bar += dGO_X0_bar.T[None, :, :] * X0.T[:, None, :]
+
+    # Trade shares
+    dlpi_bar = dr_bar[:, None, :] * pi * tax + dS_bar * S
+    dlt_bar += dr_bar[:, None, :] * pi / taup - dS_bar * S
+    q = -theta * dlpi_bar                                     # (N, N, J)
+    dlc_bar = np.sum(q, axis=0).T                             # (J, N)
+    dlt_bar += q
+    dlP_bar -= np.sum(q, axis=1).T
+
+    # Prices
+    dlP_bar += np.einsum('anj,jn->an', p['G'], dlc_bar)
+    rhs_bar = _solve(lin['K_lu'], dlP_bar, trans=1)
+    dlt_bar += pi * rhs_bar.T[:, None, :]
+    return dlt_bar
+
+
+def linearize(p, d, eq):
+    # Factorize the linearized system at the equilibrium eq, solved on the
+    # state d (as prepared by QGE.main; d holds the baseline values and the
+    # tariffs of eq): the price and Leontief matrices, and the (N, N)
+    # Jacobians of the normalized labor-market residual and of welfare
+    N, J = p['N'], p['J']
+    pi = eq['pi']
+
+    K = -np.einsum('nij,aij->jnai', pi, p['G']).reshape(J * N, J * N)
+    K[np.arange(J * N), np.arange(J * N)] += 1
+
+    VAn = np.sum(d['VAnj'], axis=0)
+    lin = {
+        'p': p,
+        'eq': eq,
+        'pi': pi,
+        'X': eq['X'],
+        'xbilat': eq['xbilat'],
+        'In': eq['In'],
+        'taup': d['taup'],
+        'ltau_hat': np.log(d['tau_hat']),
+        'S': pi / d['taup'],
+        'tax': (d['taup'] - 1) / d['taup'],
+        'VAn': VAn,
+        'VAn_w': VAn * eq['w_hat'],
+        'welfare': eq['In'] / d['In'] / eq['Pn_hat'],
+        'K_lu': lu_factor(K),
+        'L_lu': factorize_leontief(pi, p, d),
+    }
+
+    # Walras' law leaves dZ/dlw singular along one direction; as in the
+    # Newton-Krylov solver, solve F = Z - (a'w_hat - a'w_hat0) instead
+    a = VAn / np.sum(VAn)
+    dlt = np.zeros((N, N, J))
+    jac = np.empty((N, N))
+    lin['W_w'] = np.empty((N, N))
+    for k in range(0, N, CHUNK):
+        columns = _chain(lin, np.eye(N)[k:k + CHUNK], dlt)
+        jac[:, k:k + CHUNK] = columns['dZ'].T
+        lin['W_w'][:, k:k + CHUNK] = columns['dlW'].T
+    lin['F_lu'] = lu_factor(jac - (a * eq['w_hat'])[None, :])
+    return lin
+
+
+def predict(lin, tau_hat):
+    # Linearized counterfactual for tau_hat: the keys of an equilibrium
+    # output, with hats log-linear and levels linear in the changes, plus
+    # 'error', the largest second-order term of the sectoral price indices
+    # the approximation drops (in log points). The error grows with the
+    # square of the tariff change; the full solve is exact.
+    p, eq = lin['p'], lin['eq']
+    theta = p['theta']
+    dlt = np.log(tau_hat) - lin['ltau_hat']
+
+    tariffs = _chain(lin, np.zeros(p['N']), dlt)
+    dlw = -lu_solve(lin['F_lu'], tariffs['dZ'])
+    dwages = _chain(lin, dlw, np.zeros_like(dlt))
+    change = {key: tariffs[key] + dwages[key] for key in tariffs}
+
+    # Second-order term of -1/theta log sum_i pi exp(-theta x): the
+    # trade-share weighted variance of x = dlc + dlt across exporters
+    x = change['dlc'].T[None, :, :] + dlt                     # (N, N, J)
+    mean = np.sum(lin['pi'] * x, axis=1)                      # (N, J)
+    var = np.sum(lin['pi'] * x ** 2, axis=1) - mean ** 2
+    error = float(np.max(0.5 * theta * np.maximum(var, 0)))
+
+    dlP = change['dlP']
+    return {
+        'w_hat': eq['w_hat'] * np.exp(change['dlw']),
+        'P_hat': eq['P_hat'] * np.exp(dlP),
+        'Pn_hat': eq['Pn_hat'] * np.exp(np.sum(p['alpha'] * dlP, axis=0)),
+        'X': eq['X'] + change['dX'],
+        'xbilat': eq['xbilat'] + change['dxbilat'],
+        'GO': eq['GO'] + change['dGO'],
+        'VAnj': p['B'] * (eq['GO'] + change['dGO']),
+        'Expenditure': eq['Expenditure'] + change['dExpenditure'],
+        'Ex': eq['Ex'] + change['dEx'],
+        'Im': eq['Im'] + change['dIm'],
+        'In': eq['In'] + change['dIn'],
+        'error': error,
+        'linear': True,
+    }
+
+
+def welfare_gradient(lin, country):
+    # d welfare[country] / d tau_hat (N, N, J) at the linearization point,
+    # for every tariff line at once. The wage response enters through one
+    # transposed (N, N) solve, then a single adjoint pass of the tariff
+    # chain gives all lines.
+    tau_hat = np.exp(lin['ltau_hat'])
+    W_bar = np.zeros(lin['p']['N'])
+    W_bar[country] = 1
+    # dlW = W_t dlt + W_w dlw with F dlw = -Z_t dlt
+    Z_bar = -lu_solve(lin['F_lu'], lin['W_w'][country], trans=1)
+    dlt_bar = _chain_adjoint(lin, Z_bar, W_bar)
+    return lin['welfare'][country] * dlt_bar / tau_hat
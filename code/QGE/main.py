@@ -2,29 +2,19 @@ import sys
 import numpy as np
 import pandas as pd
 import os
-import copy
+import time
+from contextlib import nullcontext
 from functools import lru_cache
+from QGE.batch import equilibrium_batch
+from QGE.cache import ResultCache, digest
 from QGE.equilibrium import equilibrium
+from QGE.linear import linearize, predict, welfare_gradient as _welfare_gradient
+from QGE.EX import factorize_leontief
 from QGE.data import data
-
-
-def _expand_indices(indices, size):
-    if indices:
-        return indices
-    return list(range(size))
-
-
-def _iter_counterfactual_rules(ctf, p):
-    for rule_entries in ctf.values():
-        entries = rule_entries if isinstance(rule_entries, list) else [rule_entries]
-        for entry in entries:
-            yield {
-                'importers': _expand_indices(entry.get('importer_indices', []), p['N']),
-                'exporters': _expand_indices(entry.get('exporter_indices', []), p['N']),
-                'sectors': _expand_indices(entry.get('sector_indices', []), p['J']),
-                'free_trade': entry.get('free_trade', False),
-                'tariff_change': entry.get('tariff_change', 0.0),
-            }
+from QGE.profiling import Profiler
+from QGE.rules import apply_rules, compile_rules
+from QGE.shared import attach_state
+from QGE.warm import SolutionStore, apply_seed
 
 
 @lru_cache(maxsize=1)
@@ -37,13 +27,188 @@ def _load_calibrated_state(output_dir):
     return p, d, baseline
 
 
-def run(ctf):
+def _output_dir():
+    CURRENT = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(os.path.dirname(CURRENT)), 'output')
+
+
+# Calibration mapped from files written by QGE.shared.publish_state; when
+# set (e.g. in sweep workers) it replaces loading output_dir
+_shared_state = None
+
+
+def use_shared_state(path):
+    global _shared_state
+    _shared_state = None if path is None else attach_state(path)
+
+
+def _calibrated_state(output_dir):
+    if _shared_state is not None:
+        return _shared_state
+    return _load_calibrated_state(output_dir)
+
+
+def _read_only(values):
+    # Shallow copy of a state dict whose arrays are read-only views
+    shared = {}
+    for key, value in values.items():
+        if isinstance(value, np.ndarray):
+            value = value.view()
+            value.flags.writeable = False
+        shared[key] = value
+    return shared
+
+
+def calibrated_state():
+    # The calibrated (p, d, baseline) that runs start from, as read-only
+    # views (e.g. for the dimensions p['N'] and p['J'])
+    return tuple(_read_only(values)
+                 for values in _calibrated_state(_output_dir()))
+
+
+def _scenario_state(state):
+    # Working state for one run. The calibrated arrays are cached per
+    # process (or mapped from shared files) and only read by the solver:
+    # hand out read-only views of them and copy just the tariff array the
+    # rules write to. Anything else a run changes is rebound, not mutated.
+    p, d, baseline = (_read_only(values) for values in state)
+    d['tau_hat'] = np.array(d['tau_hat'])
+    return p, d, baseline
+
+
+# Digest of the calibrated state, computed once per state object
+_calibration_digest = (None, None)
+
+
+def _calibration_id(state):
+    global _calibration_digest
+    if _calibration_digest[0] is not state:
+        _calibration_digest = (state, digest(state))
+    return _calibration_digest[1]
+
+
+@lru_cache(maxsize=None)
+def _cache_at(path):
+    return ResultCache(path)
+
+
+def result_cache(cache=True):
+    # The ResultCache a run uses: True for output/cache, a directory, or a
+    # ResultCache; one instance per directory per process, so its hit and
+    # miss counts add up across runs
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return _cache_at(os.path.join(_output_dir(), 'cache'))
+    if isinstance(cache, (str, os.PathLike)):
+        return _cache_at(os.path.abspath(cache))
+    return cache
+
+
+# Part of every cache key; bump it when a solver change alters results, so
+# counterfactuals cached by earlier code are not served
+SOLVER_VERSION = 1
+
+
+def _cache_key(state, p, d):
+    # Counterfactuals are identified by the solver version, the calibration,
+    # the scalar solver settings and the compiled tariff changes, whatever
+    # payload wrote them
+    settings = {key: value for key, value in p.items()
+                if not key.startswith('_')
+                and isinstance(value, (bool, int, float, str, type(None)))}
+    return digest(SOLVER_VERSION, _calibration_id(state), settings,
+                  d['tau_hat'])
+
+
+# Solutions of this process's runs, seeding later ones (warm_start=True)
+_solutions = SolutionStore()
+
+
+def solution_store(warm_start=True):
+    # The SolutionStore a run seeds from and adds to: True for the
+    # process-wide store, or a SolutionStore
+    if warm_start is None or warm_start is False:
+        return None
+    if warm_start is True:
+        return _solutions
+    return warm_start
+
+
+def _warm_start(store, state, d):
+    # Seed wages, prices and output from the solved scenarios closest in
+    # tariffs (QGE.warm), unless the baseline the cold start begins from is
+    # closer. Returns the distance to the nearest one, or None.
+    base = (state[1]['tau_hat'], {'w_hat': d['w_hat0'], 'P_hat': d['P_hat0'],
+                                  'X': d['X']})
+    prediction = store.predict(d['tau_hat'], base)
+    if prediction is None:
+        return None
+    distance, seed = prediction
+    apply_seed(d, seed)
+    return distance
+
+
+@lru_cache(maxsize=1)
+def _load_baseline_factorization(output_dir):
+    # The baseline Leontief matrix is shared by every counterfactual on this
+    # calibration; factorize it once and use it to precondition EX solves.
+    p, d, baseline = _calibrated_state(output_dir)
+    return factorize_leontief(baseline['pi'], p, d)
+
+
+@lru_cache(maxsize=1)
+def _load_linearization(output_dir):
+    # Factorized first-order system around the baseline (QGE.linear); built
+    # once per calibration, after which previews are linear solves
+    p, d, baseline = _scenario_state(_calibrated_state(output_dir))
+    _prepare_state(p, d, baseline, None, output_dir)
+    return linearize(p, d, baseline)
+
+
+def _prepare_state(p, d, baseline, options, output_dir):
+    # Start counterfactuals from the solved baseline with the run settings
+    d.update({
+        'X': baseline['X'],
+        'GO': baseline['GO'],
+        'Expenditure': baseline['Expenditure'],
+        'pi': baseline['pi'],
+        'VAnj': baseline['VAnj'],
+        'In': baseline['In'],
+        'xbilat': baseline['xbilat'],
+        'Im': baseline['Im'],
+        'Ex': baseline['Ex'],
+    })
+    p.update({'tol': 1e-6})
+    p.update(options or {})
+    if p.get('ex_solver') == 'krylov' and p.get('ex_precondition'):
+        p['_ex_lu'] = _load_baseline_factorization(output_dir)
+
+
+def _apply_rules(ctf, p, d):
+    # Write the tariff changes of a counterfactual payload into d['tau_hat'];
+    # returns False when the payload leaves it unchanged
+    rules = compile_rules(ctf, p['N'], p['J'])
+    return apply_rules(rules, d['tau_hat'], d['tau'])
+
+
+def _unchanged(baseline):
+    # A payload that changes no tariff has the baseline as its equilibrium
+    return dict(baseline, it=0, evals=0, ep_it=0, anderson_steps=0,
+                anderson_restarts=0, status='converged',
+                noop=True, telemetry=[])
+
+
+def _run(ctf, options, callback, profiler, deadline, cancel, cache,
+         store):
     CURRENT = os.path.dirname(os.path.abspath(__file__))
     PROJECT = os.path.dirname(os.path.dirname(CURRENT))
     DATA = os.path.join(PROJECT, 'data')
     OUTPUT = os.path.join(PROJECT, 'output')
 
     BASELINE = 0
+    timed = profiler.stage if profiler is not None else (
+        lambda name: nullcontext())
 
     if BASELINE:
         # Calibrate baseline data
@@ -51,27 +216,19 @@ def run(ctf):
         np.save(os.path.join(OUTPUT, 'p.npy'), p)
         np.save(os.path.join(OUTPUT, 'baseline', 'd.npy'), d)
 
-        baseline = equilibrium(d, p)
+        baseline = equilibrium(d, p, callback=callback)
 
         np.save(os.path.join(OUTPUT, 'baseline', 'baseline.npy'), baseline)
 
     else:
         # Load baseline data
-        p, d, baseline = (
-            copy.deepcopy(obj) for obj in _load_calibrated_state(OUTPUT)
-        )
-        d.update({
-            'X': baseline['X'],
-            'GO': baseline['GO'],
-            'Expenditure': baseline['Expenditure'],
-            'pi': baseline['pi'],
-            'VAnj': baseline['VAnj'],
-            'In': baseline['In'],
-            'xbilat': baseline['xbilat'],
-            'Im': baseline['Im'],
-            'Ex': baseline['Ex'],
-        })
-        p.update({'tol': 1e-6})
+        with timed('load'):
+            state = _calibrated_state(OUTPUT)
+        with timed('copy'):
+            p, d, baseline = _scenario_state(state)
+        _prepare_state(p, d, baseline, options, OUTPUT)
+        if profiler is not None:
+            p['_profiler'] = profiler
 
         # Check that equilibrium converges in one iteration
         # output = equilibrium(d, p)
@@ -82,26 +239,187 @@ def run(ctf):
         #     print('Passed')
 
         # Counterfactual
-        for rule in _iter_counterfactual_rules(ctf, p):
-            importers = rule['importers']
-            exporters = rule['exporters']
-            sectors = rule['sectors']
-
-            if rule['free_trade']:
-                d['tau_hat'][np.ix_(importers, exporters, sectors)] = 1 / \
-                    d['tau'][np.ix_(importers, exporters, sectors)]
+        with timed('rules'):
+            changed = _apply_rules(ctf, p, d)
+            d['taup'] = d['tau_hat']*d['tau']
+        counterfactual = key = None
+        if cache is not None and changed:
+            with timed('cache'):
+                key = _cache_key(state, p, d)
+                counterfactual = cache.get(key)
+
+        if counterfactual is not None:
+            counterfactual['cached'] = True
+        elif changed:
+            # A continuation path starts from the baseline
+            if store is not None and not p.get('continuation', False):
+                warm_start = _warm_start(store, state, d)
             else:
-                tariff_change = rule['tariff_change']
-                if tariff_change is None:
-                    tariff_change = 0.0
-                d['tau_hat'][np.ix_(importers, exporters, sectors)] = 1 + \
-                    tariff_change / 100
+                warm_start = None
+            budget = None if deadline is None else deadline - time.monotonic()
+            with timed('equilibrium'):
+                counterfactual = equilibrium(d, p, callback=callback,
+                                             budget=budget, cancel=cancel)
+            if key is not None and counterfactual['status'] == 'converged':
+                with timed('cache'):
+                    cache.put(key, counterfactual)
+                counterfactual['cached'] = False
+            if store is not None:
+                counterfactual['warm_start'] = warm_start
+        else:
+            counterfactual = _unchanged(baseline)
 
-            for importer in importers:
-                for sector in sectors:
-                    d['tau_hat'][importer, importer, sector] = 1
+        if (store is not None and changed
+                and counterfactual['status'] == 'converged'):
+            store.add(d['tau_hat'], counterfactual)
 
-        d['taup'] = d['tau_hat']*d['tau']
-        counterfactual = equilibrium(d, p)
+        if profiler is not None:
+            p.pop('_profiler')
+            counterfactual['profile'] = profiler.to_dict()
 
         return counterfactual, d, p
+
+
+def run(ctf, options=None, callback=None, profile=None, budget=None,
+        cancel=None, cache=None, warm_start=None):
+    # callback: receives equilibrium telemetry records as they are produced
+    # profile: True or a Profiler to record stage timings and allocations
+    # in counterfactual['profile'], or a path to also write them as JSON
+    # budget, cancel: wall-clock seconds for the whole run and a token with
+    # is_set(); when either trips, the partial equilibrium is returned with
+    # counterfactual['status'] set to 'timeout' or 'cancelled'
+    # cache: True, a directory or a ResultCache (see result_cache) to reuse
+    # converged solutions of identical counterfactuals across runs
+    # warm_start: True or a SolutionStore (see solution_store) to start
+    # from the closest previously solved scenario instead of the baseline
+    deadline = None if budget is None else time.monotonic() + budget
+    profiler = None
+    if profile:
+        profiler = profile if isinstance(profile, Profiler) else Profiler()
+
+    with profiler or nullcontext():
+        results = _run(ctf, options, callback, profiler, deadline, cancel,
+                       result_cache(cache), solution_store(warm_start))
+
+    if profiler is not None and isinstance(profile, (str, os.PathLike)):
+        profiler.write(profile)
+
+    return results
+
+
+def run_batch(ctfs, options=None, callback=None):
+    # Solve several counterfactual payloads on the calibrated baseline in
+    # one scenario-stacked equilibrium (QGE.batch). Results are stacked
+    # along a leading scenario axis, as are d['tau_hat'] and d['taup'].
+    OUTPUT = _output_dir()
+
+    p, d, baseline = _scenario_state(_calibrated_state(OUTPUT))
+    _prepare_state(p, d, baseline, options, OUTPUT)
+
+    tau_hat0 = d['tau_hat']
+    tau_hat = np.empty((len(ctfs),) + tau_hat0.shape)
+    for s, ctf in enumerate(ctfs):
+        d['tau_hat'] = tau_hat0.copy()
+        _apply_rules(ctf, p, d)
+        tau_hat[s] = d['tau_hat']
+    d['tau_hat'] = tau_hat
+    d['taup'] = tau_hat * d['tau']
+
+    counterfactuals = equilibrium_batch(d, p, tau_hat, callback=callback)
+
+    return counterfactuals, d, p
+
+
+# Outputs kept for each stage of a schedule (run_schedule)
+SCHEDULE_KEYS = ('w_hat', 'P_hat', 'Pn_hat', 'X', 'GO', 'VAnj',
+                 'Expenditure', 'Ex', 'Im', 'In')
+
+
+def run_schedule(ctfs, options=None, callback=None):
+    # Solve a phased policy: stage k applies ctfs[k] on top of the tariffs
+    # in force after stage k - 1 (rules set tariff levels, so a line keeps
+    # its tariff until a later stage sets it). Each stage starts from the
+    # secant through the two previous equilibria (QGE.warm), its output
+    # seeding the EX solves; Krylov EX solves keep the cached baseline
+    # preconditioner (a new factorization per stage costs more than it
+    # saves). Results are stacked along a leading stage axis:
+    # SCHEDULE_KEYS, welfare (In / In_baseline / Pn_hat), it, evals, ep_it
+    # and status; d['tau_hat'] and d['taup'] likewise. callback records
+    # carry the stage.
+    if len(ctfs) == 0:
+        raise ValueError("schedule must contain at least one phase")
+    OUTPUT = _output_dir()
+
+    state = _calibrated_state(OUTPUT)
+    p, d, baseline = _scenario_state(state)
+    _prepare_state(p, d, baseline, options, OUTPUT)
+
+    store = SolutionStore(size=2)
+    previous = _unchanged(baseline)
+    stages = []
+    tau_hat = []
+    for k, ctf in enumerate(ctfs):
+        if _apply_rules(ctf, p, d):
+            d_k = dict(d, tau_hat=d['tau_hat'].copy())
+            d_k['taup'] = d_k['tau_hat']*d['tau']
+            _warm_start(store, state, d_k)
+            stage_callback = None if callback is None else (
+                lambda record, k=k: callback(dict(record, stage=k)))
+            previous = equilibrium(d_k, p, callback=stage_callback)
+            store.add(d_k['tau_hat'], previous)
+        else:
+            # Same tariffs as the previous stage
+            previous = dict(previous, it=0, evals=0, ep_it=0,
+                            anderson_steps=0, anderson_restarts=0)
+        stages.append(previous)
+        tau_hat.append(d['tau_hat'].copy())
+
+    path = {key: np.stack([stage[key] for stage in stages])
+            for key in SCHEDULE_KEYS}
+    path['welfare'] = path['In'] / baseline['In'] / path['Pn_hat']
+    for key in ('it', 'evals', 'ep_it'):
+        path[key] = np.array([stage[key] for stage in stages])
+    path['status'] = [stage['status'] for stage in stages]
+
+    d['tau_hat'] = np.stack(tau_hat)
+    d['taup'] = d['tau_hat'] * d['tau']
+    return path, d, p
+
+
+def preview(ctf):
+    # Linearized counterfactual (QGE.linear.predict) for a quick look at a
+    # scenario: equilibrium output keys plus 'error', the estimated
+    # second-order error in log prices. Returns (preview, d, p) like run.
+    OUTPUT = _output_dir()
+    lin = _load_linearization(OUTPUT)
+
+    p, d, baseline = _scenario_state(_calibrated_state(OUTPUT))
+    _prepare_state(p, d, baseline, None, OUTPUT)
+    _apply_rules(ctf, p, d)
+    d['taup'] = d['tau_hat']*d['tau']
+
+    return predict(lin, d['tau_hat']), d, p
+
+
+def welfare_gradient(ctf, countries=None, options=None):
+    # Gradient of welfare (In / In_baseline / Pn_hat) with respect to every
+    # tariff line tau_hat[i, e, j] at the solved counterfactual, by adjoint
+    # sensitivity (QGE.linear): (N, N, J) for one country, stacked along a
+    # leading axis for a list of countries (all by default). Returns
+    # (gradient, counterfactual). Domestic lines, which rules keep at 1,
+    # have zero gradient.
+    counterfactual, d, p = run(ctf, options)
+    if counterfactual['status'] != 'converged':
+        raise RuntimeError(
+            f"Counterfactual did not converge ({counterfactual['status']})")
+
+    lin = linearize(p, d, counterfactual)
+    if countries is None:
+        countries = range(p['N'])
+    gradient = np.stack([_welfare_gradient(lin, n)
+                         for n in np.atleast_1d(countries)])
+    # Rules never tariff domestic flows, so those lines cannot move
+    gradient[:, np.arange(p['N']), np.arange(p['N']), :] = 0
+    if np.ndim(countries) == 0:
+        gradient = gradient[0]
+    return gradient, counterfactual
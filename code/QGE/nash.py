@@ -0,0 +1,91 @@
+import time
+from contextlib import ExitStack
+
+import numpy as np
+
+from QGE import main
+from QGE.optimal import optimal_tariffs, tariff_rules
+from QGE.sweep import pool
+
+
+def _best_response(country, tariffs, options, bounds, x0):
+    # Optimal tariffs of country against the others' current tariffs,
+    # seeded from its previous schedule and this process's solved scenarios
+    others = {f'tariffs_{other}': tariff_rules(other, changes)
+              for other, changes in tariffs.items() if other != country}
+    result = optimal_tariffs(country, ctf=others, options=options,
+                             bounds=bounds, x0=x0, warm_start=True)
+    return {key: result[key] for key in
+            ('tariff_change', 'welfare', 'success', 'evals')}
+
+
+def tariff_war(countries, options=None, bounds=(0.0, 100.0), x0=None,
+               step=1.0, tol=1e-2, max_rounds=50, workers=None,
+               blas_threads=1, mp_context='spawn', shared=True):
+    # Nash equilibrium in import tariffs by sector among countries, by
+    # simultaneous best responses: each round every country re-optimizes
+    # (QGE.optimal) against the others' tariffs of the previous round, all
+    # countries in parallel on a process pool (QGE.sweep.pool; workers=0
+    # runs them in this process). Yields one record per round:
+    #   'round', 'tariff_change' and 'welfare' by country, 'change' (largest
+    #   move of any tariff, percentage points), 'evals' by country,
+    #   'elapsed' seconds and 'converged' (change <= tol).
+    # step < 1 damps the update towards the best responses. Raises
+    # RuntimeError when max_rounds pass without convergence.
+    countries = list(countries)
+    J = main.calibrated_state()[0]['J']
+    tariffs = {country: np.zeros(J) for country in countries}
+    tariffs.update({country: np.asarray(changes, dtype=float)
+                    for country, changes in (x0 or {}).items()})
+    start = time.perf_counter()
+
+    with ExitStack() as stack:
+        if workers == 0:
+            submit = _Immediate
+        else:
+            submit = stack.enter_context(
+                pool(workers, blas_threads, mp_context, shared)).submit
+
+        for round_ in range(1, max_rounds + 1):
+            futures = {country: submit(_best_response, country, tariffs,
+                                       options, bounds, tariffs[country])
+                       for country in countries}
+            results = {country: future.result()
+                       for country, future in futures.items()}
+
+            change = 0.0
+            for country, result in results.items():
+                update = tariffs[country] + step * (
+                    result['tariff_change'] - tariffs[country])
+                change = max(change, float(np.max(np.abs(
+                    update - tariffs[country]))))
+                tariffs[country] = update
+
+            converged = change <= tol
+            yield {
+                'round': round_,
+                'tariff_change': {country: tariffs[country].copy()
+                                  for country in countries},
+                'welfare': {country: result['welfare']
+                            for country, result in results.items()},
+                'change': change,
+                'evals': {country: result['evals']
+                          for country, result in results.items()},
+                'elapsed': time.perf_counter() - start,
+                'converged': converged,
+            }
+            if converged:
+                return
+
+    raise RuntimeError(
+        f"Tariff war did not converge within {max_rounds} rounds. "
+        f"Last change: {change}")
+
+
+class _Immediate:
+    # Future-like call made in this process, for workers=0
+    def __init__(self, fn, *args):
+        self.value = fn(*args)
+
+    def result(self):
+        return self.value
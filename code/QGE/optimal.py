@@ -0,0 +1,100 @@
+import numpy as np
+from scipy.optimize import minimize
+
+from QGE import main
+from QGE.linear import linearize, welfare_gradient
+from QGE.warm import SolutionStore
+
+
+# Solver settings for the many solves of a search: Krylov EX solves, each
+# started from the previous output (the baseline preconditioner is opt-in
+# through options; near the warm start it costs more than it saves)
+SEARCH_OPTIONS = {'ex_solver': 'krylov'}
+
+
+def tariff_rules(country, changes, exporters=None):
+    # Payload entry setting country's import tariffs by sector: changes[j]
+    # (percent, as tariff_change) on imports of sector j from exporters
+    # (every other country by default)
+    exporters = [] if exporters is None else list(exporters)
+    return [{'importer_indices': [country], 'exporter_indices': exporters,
+             'sector_indices': [j], 'tariff_change': float(change)}
+            for j, change in enumerate(changes)]
+
+
+def _welfare(counterfactual, d, country):
+    return counterfactual['In'][country] / d['In'][country] / \
+        counterfactual['Pn_hat'][country]
+
+
+def optimal_tariffs(country, ctf=None, options=None, bounds=(0.0, 100.0),
+                    x0=None, exporters=None, maxiter=100, tol=1e-8,
+                    callback=None, warm_start=None):
+    # Import tariffs by sector (tariff_change, percent) maximizing country's
+    # welfare In / In_baseline / Pn_hat, by L-BFGS-B within bounds. ctf
+    # holds the other rules in force (e.g. other countries' tariffs); the
+    # country's tariffs are added as rule f'tariffs_{country}'. Each
+    # evaluation solves the counterfactual warm-started from the previous
+    # ones and takes the gradient over all sectors from one adjoint pass
+    # (QGE.linear). The linearization behind that pass is rebuilt at every
+    # evaluated point rather than reused from a nearby one: stale factors
+    # would make the gradient inexact, which the L-BFGS-B line search and
+    # gtol assume it is not. callback receives one record per evaluation.
+    # warm_start: the SolutionStore the solves seed from (see
+    # QGE.main.solution_store), a new one for this search by default
+    ctf = dict(ctf or {})
+    options = dict(SEARCH_OPTIONS, **(options or {}))
+    J = main.calibrated_state()[0]['J']
+    key = f'tariffs_{country}'
+    store = main.solution_store(warm_start) or SolutionStore()
+    history = []
+    last = {}
+
+    def evaluate(x):
+        if 'x' in last and np.array_equal(last['x'], x):
+            return last
+        scenario = dict(ctf, **{key: tariff_rules(country, x, exporters)})
+        counterfactual, d, p = main.run(scenario, options, warm_start=store)
+        welfare = _welfare(counterfactual, d, country)
+
+        # d log welfare / d tariff_change: tau_hat = 1 + change / 100 on the
+        # country's lines, except the domestic ones the rules keep at 1
+        gradient = welfare_gradient(linearize(p, d, counterfactual), country)
+        lines = gradient[country] / welfare / 100             # (N, J)
+        lines[country] = 0
+        if exporters is not None:
+            lines = lines[list(exporters)]
+
+        last.update({'x': np.array(x), 'welfare': welfare,
+                     'gradient': np.sum(lines, axis=0),
+                     'counterfactual': counterfactual, 'ctf': scenario})
+        history.append({'evals': len(history) + 1, 'welfare': welfare,
+                        'tariff_change': last['x'],
+                        'it': counterfactual['it']})
+        if callback is not None:
+            callback(history[-1])
+        return last
+
+    def objective(x):
+        record = evaluate(x)
+        return -np.log(record['welfare']), -record['gradient']
+
+    x0 = np.zeros(J) if x0 is None else np.asarray(x0, dtype=float)
+    result = minimize(objective, x0, jac=True, method='L-BFGS-B',
+                      bounds=[bounds] * J,
+                      options={'maxiter': maxiter, 'ftol': tol, 'gtol': tol})
+
+    best = evaluate(result.x)
+    return {
+        'country': country,
+        'tariff_change': best['x'],
+        'welfare': best['welfare'],
+        'gradient': best['gradient'],
+        'counterfactual': best['counterfactual'],
+        'ctf': best['ctf'],
+        'success': result.success,
+        'message': result.message,
+        'nit': result.nit,
+        'evals': len(history),
+        'history': history,
+    }
@@ -0,0 +1,86 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+def stage(p, name):
+    # Profile a block when a Profiler is attached to p as p['_profiler']
+    profiler = p.get('_profiler')
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+
+class Profiler:
+    # Cumulative and per-call wall time by stage, with the peak and net
+    # traced allocation (tracemalloc, which numpy reports to) when memory
+    # tracing is enabled. Stages may nest, e.g. 'EX' > 'EX.solve'.
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.calls = {}
+        self._stack = []
+        self._started = False
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        return self
+
+    def __exit__(self, *exc):
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        frame = None
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]  # [traced at entry, peak so far]
+            self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = alloc_bytes = 0
+            if frame is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                self._stack.pop()
+                peak = max(frame[1], peak)
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+                peak_bytes = peak - frame[0]
+                alloc_bytes = current - frame[0]
+            calls = self.calls.setdefault(
+                name, {'time': [], 'peak_bytes': [], 'alloc_bytes': []})
+            calls['time'].append(seconds)
+            calls['peak_bytes'].append(peak_bytes)
+            calls['alloc_bytes'].append(alloc_bytes)
+
+    def summary(self):
+        return {
+            name: {
+                'calls': len(c['time']),
+                'total': sum(c['time']),
+                'mean': sum(c['time']) / len(c['time']),
+                'max': max(c['time']),
+                'peak_bytes': max(c['peak_bytes']),
+                'alloc_bytes': sum(c['alloc_bytes']),
+            }
+            for name, c in self.calls.items()
+        }
+
+    def to_dict(self):
+        return {'stages': self.summary(), 'calls': self.calls}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
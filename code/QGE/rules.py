@@ -0,0 +1,139 @@
+from itertools import chain
+
+import numpy as np
+
+
+# Counterfactual payloads map rule names to one entry or a list of entries:
+#   {'importer_indices': [...], 'exporter_indices': [...],
+#    'sector_indices': [...], 'free_trade': bool, 'tariff_change': pct}
+# An empty index list stands for every country or sector. Entries are
+# applied in order to the block importers x exporters x sectors of tau_hat:
+# free trade sets tau_hat = 1 / tau (removing the baseline tariff), a
+# tariff change sets tau_hat = 1 + tariff_change / 100 (None counts as 0).
+# Where blocks overlap, the last entry wins. Domestic flows are never
+# tariffed: tau_hat[i, i, s] = 1 for every importer i and sector s an entry
+# names, whatever the exporters.
+
+
+def _expand_indices(indices, size):
+    if indices:
+        return indices
+    return list(range(size))
+
+
+def iter_counterfactual_rules(ctf, N, J):
+    for rule_entries in ctf.values():
+        entries = rule_entries if isinstance(rule_entries, list) else [rule_entries]
+        for entry in entries:
+            yield {
+                'importers': _expand_indices(entry.get('importer_indices', []), N),
+                'exporters': _expand_indices(entry.get('exporter_indices', []), N),
+                'sectors': _expand_indices(entry.get('sector_indices', []), J),
+                'free_trade': entry.get('free_trade', False),
+                'tariff_change': entry.get('tariff_change', 0.0),
+            }
+
+
+# Blocks larger than BLOCK entries are written by broadcasting, rule by
+# rule; smaller ones are expanded together, CHUNK entries at a time
+BLOCK = 1 << 12
+CHUNK = 1 << 22
+
+
+def _concat(rules, key, size):
+    # Index lists of all rules along one axis, concatenated; fancy indexing
+    # validates them and wraps negative indices
+    lengths = np.array([len(rule[key]) for rule in rules])
+    flat = np.arange(size)[
+        np.array(list(chain.from_iterable(rule[key] for rule in rules)))]
+    return flat, lengths, np.cumsum(lengths) - lengths
+
+
+def _product(rule_ids, axes):
+    # Every entry of the Cartesian products of the given rules' index lists:
+    # the rule of each entry and its index along each axis
+    n = np.prod([lengths[rule_ids] for _, lengths, _ in axes], axis=0)
+    rule = np.repeat(rule_ids, n)
+    t = np.arange(rule.size) - np.repeat(np.cumsum(n) - n, n)
+    indices = []
+    for flat, lengths, starts in reversed(axes):
+        m = lengths[rule]
+        indices.append(flat[starts[rule] + t % m])
+        t //= m
+    return rule, indices[::-1]
+
+
+def _outer(*axes):
+    # Outer-product index like np.ix_, taking axes that cover every index in
+    # order as slices, which numpy reads and writes as strided blocks
+    index = [slice(None) if idx.size == size and np.all(idx == np.arange(size))
+             else idx for idx, size in axes]
+    arrays = [k for k, idx in enumerate(index) if not isinstance(idx, slice)]
+    for n, k in enumerate(arrays):
+        shape = [1] * len(arrays)
+        shape[n] = -1
+        index[k] = index[k].reshape(shape)
+    return tuple(index)
+
+
+def compile_rules(ctf, N, J):
+    # Compile a payload into tensors, without a Python loop over blocks:
+    # 'owner' (N, N, J), the last rule writing each entry (-1 for none);
+    # per-rule 'value' and 'free_trade'; and 'diagonal' (N, J), the
+    # importer-sector pairs whose domestic entry is reset to 1
+    rules = list(iter_counterfactual_rules(ctf, N, J))
+    owner = np.full((N, N, J), -1)
+    diagonal = np.zeros((N, J), dtype=bool)
+    value = np.array([1 + (rule['tariff_change'] or 0.0) / 100
+                      for rule in rules])
+    free_trade = np.array([bool(rule['free_trade']) for rule in rules],
+                          dtype=bool)
+
+    if rules:
+        importers = _concat(rules, 'importers', N)
+        exporters = _concat(rules, 'exporters', N)
+        sectors = _concat(rules, 'sectors', J)
+        size = importers[1] * exporters[1] * sectors[1]
+
+        # Later rules have larger ids, so the maximum id writing an entry is
+        # its last writer, whatever order the rules are processed in
+        for r in np.flatnonzero(size > BLOCK):
+            I, E, S = (flat[starts[r]:starts[r] + lengths[r]]
+                       for flat, lengths, starts in
+                       (importers, exporters, sectors))
+            block = _outer((I, N), (E, N), (S, J))
+            owner[block] = np.maximum(owner[block], r)
+            diagonal[_outer((I, N), (S, J))] = True
+
+        small = np.flatnonzero(size <= BLOCK)
+        cum = np.cumsum(size[small])
+        bounds = np.unique(np.concatenate([
+            [0], np.searchsorted(cum, np.arange(CHUNK, cum[-1:].sum(), CHUNK)),
+            [small.size]]))
+        for r0, r1 in zip(bounds[:-1], bounds[1:]):
+            rule, (i, e, s) = _product(small[r0:r1],
+                                       [importers, exporters, sectors])
+            np.maximum.at(owner.reshape(-1), (i * N + e) * J + s, rule)
+            _, (i, s) = _product(small[r0:r1], [importers, sectors])
+            diagonal.reshape(-1)[i * J + s] = True
+
+    return {'owner': owner, 'value': value, 'free_trade': free_trade,
+            'diagonal': diagonal}
+
+
+def apply_rules(rules, tau_hat, tau):
+    # Write compiled rules into tau_hat in place; returns False when the
+    # scenario leaves tau_hat unchanged
+    owner = rules['owner']
+    written = owner >= 0
+    new = tau_hat.copy()
+    if np.any(written):
+        new[written] = np.where(rules['free_trade'][owner[written]],
+                                1 / tau[written],
+                                rules['value'][owner[written]])
+    importers, sectors = np.nonzero(rules['diagonal'])
+    new[importers, importers, sectors] = 1
+
+    changed = not np.array_equal(new, tau_hat)
+    tau_hat[...] = new
+    return changed
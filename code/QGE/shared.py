@@ -0,0 +1,42 @@
+import os
+import pickle
+
+import numpy as np
+
+
+SECTIONS = ('p', 'd', 'baseline')
+
+
+def publish_state(state, path):
+    # Write the calibrated (p, d, baseline) under path for other processes
+    # to map: each numeric array to its own .npy file, everything else to
+    # meta.pkl. Returns path.
+    os.makedirs(path, exist_ok=True)
+    meta = {}
+    for section, values in zip(SECTIONS, state):
+        meta[section] = {'arrays': [], 'values': {}}
+        for key, value in values.items():
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                np.save(os.path.join(path, f'{section}.{key}.npy'), value)
+                meta[section]['arrays'].append(key)
+            else:
+                meta[section]['values'][key] = value
+    with open(os.path.join(path, 'meta.pkl'), 'wb') as f:
+        pickle.dump(meta, f)
+    return path
+
+
+def attach_state(path):
+    # (p, d, baseline) with the arrays as read-only memory maps of the files
+    # written by publish_state. Processes mapping the same files share their
+    # pages, so attaching costs no copy of the calibration.
+    with open(os.path.join(path, 'meta.pkl'), 'rb') as f:
+        meta = pickle.load(f)
+    state = []
+    for section in SECTIONS:
+        values = dict(meta[section]['values'])
+        for key in meta[section]['arrays']:
+            values[key] = np.load(os.path.join(path, f'{section}.{key}.npy'),
+                                  mmap_mode='r')
+        state.append(values)
+    return tuple(state)
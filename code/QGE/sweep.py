@@ -0,0 +1,143 @@
+import itertools
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from QGE import main
+from QGE.main import run
+from QGE.shared import publish_state
+
+
+RULE_FIELDS = ('importer_indices', 'exporter_indices', 'sector_indices',
+               'free_trade', 'tariff_change')
+
+# Thread-count variables read by the BLAS/OpenMP runtimes when numpy loads
+BLAS_THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                    'NUMEXPR_NUM_THREADS')
+
+
+def expand_grid(grid):
+    # One single-rule scenario per combination of the listed rule fields,
+    # e.g. {'tariff_change': [5, 10], 'sector_indices': [[0], [1]]}.
+    # Fields left out take the rule defaults (all indices, no free trade).
+    unknown = set(grid) - set(RULE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown sweep grid fields: {sorted(unknown)}")
+    fields = list(grid)
+    for values in itertools.product(*(grid[field] for field in fields)):
+        params = dict(zip(fields, values))
+        yield params, {'rule1': [params]}
+
+
+@contextmanager
+def _blas_threads(threads):
+    # Workers inherit the environment when they start, before numpy loads.
+    # Pools start them lazily on submit, so this must stay in force until
+    # the pool shuts down.
+    saved = {var: os.environ.get(var) for var in BLAS_THREAD_VARS}
+    os.environ.update(dict.fromkeys(BLAS_THREAD_VARS, str(threads)))
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _init_worker(threads, shared_path):
+    # Forked workers inherit an already-loaded BLAS; cap it at runtime when
+    # threadpoolctl is installed
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(threads)
+
+    if shared_path is not None:
+        main.use_shared_state(shared_path)
+
+
+def _solve(ctf, options, keys):
+    counterfactual, _, _ = run(ctf, options)
+    if keys is not None:
+        counterfactual = {key: counterfactual[key] for key in keys}
+    return counterfactual
+
+
+def sweep(scenarios, options=None, workers=None, blas_threads=1, keys=None,
+          mp_context='spawn', shared=True):
+    # Run counterfactuals on a process pool and yield one record per
+    # scenario as it finishes: {'index', 'params', 'result'} or, when the
+    # scenario fails, {'index', 'params', 'error'}.
+    # scenarios: a grid for expand_grid, or a list of ctf payloads
+    # workers: pool size, by default the cores divided by blas_threads;
+    #     0 runs the scenarios in this process
+    # keys: result keys to send back, all by default
+    # shared: publish the calibration once to memory-mapped files (in
+    #     /dev/shm when available) that every worker maps read-only
+    if isinstance(scenarios, dict):
+        scenarios = list(expand_grid(scenarios))
+    else:
+        scenarios = [(None, ctf) for ctf in scenarios]
+
+    if workers == 0:
+        for index, (params, ctf) in enumerate(scenarios):
+            record = {'index': index, 'params': params}
+            try:
+                record['result'] = _solve(ctf, options, keys)
+            except Exception as exc:
+                record['error'] = exc
+            yield record
+        return
+
+    with pool(workers, blas_threads, mp_context, shared) as executor:
+        futures = {
+            executor.submit(_solve, ctf, options, keys): index
+            for index, (_, ctf) in enumerate(scenarios)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            record = {'index': index, 'params': scenarios[index][0]}
+            try:
+                record['result'] = future.result()
+            except Exception as exc:
+                record['error'] = exc
+            yield record
+
+
+@contextmanager
+def pool(workers=None, blas_threads=1, mp_context='spawn', shared=True):
+    # Process pool for QGE.main.run calls: workers capped at blas_threads
+    # BLAS threads each (by default as many as fit the cores) and, with
+    # shared, mapping the calibration published once to memory-mapped files
+    # (in /dev/shm when available). Queued tasks are cancelled on exit.
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // blas_threads)
+
+    shared_dir = None
+    if shared:
+        shared_dir = tempfile.TemporaryDirectory(
+            prefix='qge-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        publish_state(main._calibrated_state(main._output_dir()),
+                      shared_dir.name)
+
+    try:
+        with _blas_threads(blas_threads):
+            executor = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context(mp_context),
+                initializer=_init_worker,
+                initargs=(blas_threads, shared_dir and shared_dir.name))
+            try:
+                yield executor
+            finally:
+                # Stop queued tasks when the caller stops consuming results
+                executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        if shared_dir is not None:
+            shared_dir.cleanup()
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+SEED_KEYS = ('w_hat', 'P_hat', 'X')
+
+
+def _log_tariffs(tau_hat):
+    return np.log(tau_hat, dtype=np.float32).reshape(-1)
+
+
+class SolutionStore:
+    # Recently solved counterfactuals, kept in memory to seed new solves:
+    # for each, log tau_hat (float32, only used for distances) and the
+    # wages, prices and output the solve converged to. Holds the last size
+    # distinct scenarios.
+    def __init__(self, size=16):
+        self.size = size
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, tau_hat, solution):
+        ltau = _log_tariffs(tau_hat)
+        seed = {}
+        for key in SEED_KEYS:
+            # Read-only, as runs hand the seeds out in d
+            seed[key] = np.array(solution[key])
+            seed[key].flags.writeable = False
+        self._entries = [entry for entry in self._entries
+                         if not np.array_equal(entry[0], ltau)]
+        self._entries.append((ltau, seed))
+        del self._entries[:-self.size]
+
+    def predict(self, tau_hat, base):
+        # Starting point for solving tau_hat: (distance, seed), or None when
+        # base is at least as close as every stored scenario. base is the
+        # (tau_hat, solution) a cold start begins from.
+        # The seed extrapolates along the line through the two scenarios
+        # closest to tau_hat (base included), projecting the tariff change
+        # onto it: for edits that keep moving the same tariffs, such as a
+        # slider, this secant step is first-order accurate where the nearest
+        # solution alone is off by the whole change.
+        ltau = _log_tariffs(tau_hat)
+        entries = self._entries + [(_log_tariffs(base[0]), base[1])]
+        distances = [float(np.sum(np.abs(entry[0] - ltau)))
+                     for entry in entries]
+        order = np.argsort(distances, kind='stable')
+        if order[0] == len(entries) - 1:
+            return None
+        (l_b, b), (l_a, a) = entries[order[0]], entries[order[1]]
+
+        step = l_b - l_a
+        t = float(np.dot(ltau - l_b, step)) / max(float(np.dot(step, step)),
+                                                   1e-300)
+        t = min(max(t, -1.0), 2.0)
+        seed = {
+            'w_hat': b['w_hat'] * (b['w_hat'] / a['w_hat']) ** t,
+            'P_hat': b['P_hat'] * (b['P_hat'] / a['P_hat']) ** t,
+            'X': np.maximum(b['X'] + t * (b['X'] - a['X']), 0),
+        }
+        return distances[order[0]], seed
+
+    def clear(self):
+        self._entries = []
+
+
+def apply_seed(d, seed):
+    # Start the solve on d from seed's wages, prices and output, with wages
+    # rescaled to the world value added of d['w_hat0'], the normalization
+    # both outer solvers keep
+    a = np.sum(d['VAnj'], axis=0)
+    w_hat = seed['w_hat'] * (a @ d['w_hat0']) / (a @ seed['w_hat'])
+    d.update({'w_hat0': w_hat, 'P_hat0': seed['P_hat'], 'X0': seed['X']})
@@ -1,19 +1,21 @@
-import io
 import os
 import sys
+import time
 import uuid
 
+import numpy as np
 import streamlit as st
 
 
 CURRENT = os.path.dirname(os.path.abspath(__file__))
 CODE_DIR = os.path.dirname(CURRENT)
 PROJECT = os.path.abspath(os.path.join(CURRENT, '..', '..'))
+RUN_BUDGET = 300  # seconds before a scenario run is stopped
 
 if CODE_DIR not in sys.path:
     sys.path.append(CODE_DIR)
 
-from QGE.main import run
+from QGE.main import preview, run
 from ui_utils import format_selection, inject_base_styles, load_catalog, render_page_header
 
 
@@ -27,20 +29,22 @@ country_labels = dict(zip(country_df['code'], country_df['label']))
 sector_labels = dict(zip(sector_df['code'], sector_df['label']))
 
 
-class StreamlitLogger(io.StringIO):
-    def __init__(self, container):
-        super().__init__()
+class StreamlitProgress:
+    def __init__(self, container, interval=0.25):
         self.container = container
+        self.interval = interval
         self.messages = []
+        self.last_render = 0.0
 
-    def write(self, message):
-        cleaned = message.strip()
-        if cleaned:
-            self.messages.append(cleaned)
-            self.container.code("\n".join(self.messages[-12:]), language="text")
+    def __call__(self, record):
+        self.messages.append(
+            f"Iteration {record['it']}: tolerance = {record['Z_err']:.3e}")
+        if time.monotonic() - self.last_render >= self.interval:
+            self.render()
 
-    def flush(self):
-        return None
+    def render(self):
+        self.last_render = time.monotonic()
+        self.container.code("\n".join(self.messages[-12:]), language="text")
 
 
 def _init_state():
@@ -79,6 +83,25 @@ def _build_policy_payload(rules):
     return payload
 
 
+def _render_preview(payload):
+    # Linearized effects of the current rules, shown before any full solve
+    estimate, d, _ = preview(payload)
+    welfare = (estimate['In'] / d['In'] / estimate['Pn_hat'] - 1.0) * 100.0
+    wages = (estimate['w_hat'] - 1.0) * 100.0
+    preview_cols = st.columns(3)
+    preview_cols[0].metric("Average welfare", f"{np.mean(welfare):+.2f}%")
+    worst = country_options[int(np.argmin(welfare))]
+    preview_cols[1].metric("Weakest welfare outcome",
+                           country_labels.get(worst, worst),
+                           delta=f"{np.min(welfare):+.2f}%")
+    preview_cols[2].metric("Largest wage change",
+                           f"{wages[np.argmax(np.abs(wages))]:+.2f}%")
+    st.caption(
+        "First-order approximation around the baseline. Estimated error in "
+        f"prices: about {estimate['error'] * 100:.2g}%. It grows with the "
+        "square of the tariff changes; run the scenario for exact results.")
+
+
 def _summary_table(rules):
     rows = []
     for idx, rule in enumerate(rules, start=1):
@@ -236,25 +259,41 @@ else:
 
 policy_payload = _build_policy_payload(st.session_state.rules)
 
+if st.session_state.rules and st.toggle("Instant preview", value=True):
+    st.markdown("### Preview")
+    try:
+        _render_preview(policy_payload)
+    except Exception as exc:
+        st.info(f"Preview unavailable: {exc}")
+
 st.markdown("### Run the model")
-run_col, nav_col = st.columns(2)
+run_col, stop_col, nav_col = st.columns(3)
 log_container = st.empty()
 
+# Clicking Stop requests a rerun: Streamlit stops the script running the
+# solve at its next st.* call (the progress log redraws every 0.25 s)
+# and reruns the page without starting a new solve
+stop_col.button("Stop", use_container_width=True)
+
 if run_col.button("Run scenario", type="primary", use_container_width=True):
-    original_stdout = sys.stdout
+    progress = StreamlitProgress(log_container)
     try:
-        sys.stdout = StreamlitLogger(log_container)
         with st.spinner("Solving the equilibrium..."):
-            model_results = run(policy_payload)
-        if model_results:
+            model_results = run(policy_payload, callback=progress,
+                                budget=RUN_BUDGET,
+                                cache=True, warm_start=True)
+        progress.render()
+        if model_results and model_results[0]['status'] != 'converged':
+            st.warning(
+                f"The solver stopped early ({model_results[0]['status']}) "
+                f"after {model_results[0]['it']} iterations; the results were not stored.")
+        elif model_results:
             st.session_state.results, st.session_state.d, st.session_state.p = model_results
             st.session_state.model_ran = True
             st.session_state.last_run_rule_count = len(st.session_state.rules)
             st.success("Scenario solved. The results page is ready.")
     except Exception as exc:
         st.error(f"Model run failed: {exc}")
-    finally:
-        sys.stdout = original_stdout
 
 if nav_col.button(
     "Open results",
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.equilibrium import equilibrium
+from synthetic import synthetic_calibration
+from QGE.warm import SolutionStore
+
+
+def _reset_process_state():
+    # Caches and seeds QGE.main keeps per process, built on whichever
+    # calibration was loaded when they were filled
+    QGE.main._load_baseline_factorization.cache_clear()
+    QGE.main._load_linearization.cache_clear()
+
+
+@pytest.fixture
+def calibration(request, monkeypatch):
+    # Synthetic (p, d, baseline) standing in for the calibrated state
+    # QGE.main loads from output/, with the baseline solved from d. Sized
+    # (N, J) by indirect parametrization,
+    #   @pytest.mark.parametrize('calibration', [(9, 4)], indirect=True),
+    # else by the test module's CALIBRATION, else (6, 3).
+    N, J = getattr(request, 'param',
+                   getattr(request.module, 'CALIBRATION', (6, 3)))
+    p, d = synthetic_calibration(N, J)
+    baseline = dict(d, **equilibrium(d, dict(p, tol=1e-10)))
+    monkeypatch.setattr(QGE.main, '_load_calibrated_state',
+                        lambda output_dir: (p, d, baseline))
+    monkeypatch.setattr(QGE.main, '_solutions', SolutionStore())
+    _reset_process_state()
+    yield p, d, baseline
+    _reset_process_state()
@@ -0,0 +1,89 @@
+import numpy as np
+from scipy.linalg import lu_solve
+from QGE.EX import EX, factorize_leontief
+
+
+def synthetic_calibration(N, J, seed=0, tariff=0.1, deficit=0.02):
+    # Random calibration with the same layout as QGE.data.data, used for
+    # tests and benchmarks when the ICIO calibration is not available.
+    # Imports QGE, so CODE_DIR must be on sys.path first.
+    rng = np.random.default_rng(seed)
+
+    p = {
+        'N': N,
+        'J': J,
+        'VA': 1,
+        'FD': 1,
+        'MISC': 0,
+        'tol': 1e-10,
+        'v': 0.7,
+        'maxit': 1e10,
+        'NJ': N * J,
+    }
+
+    # Labor shares and input-output coefficients
+    B = rng.uniform(0.3, 0.6, size=(J, N))                   # (J, N)
+    gamma = rng.dirichlet(np.ones(J), size=(N, J))           # (N, J1, J2)
+    G = np.transpose(gamma, (2, 0, 1)) * (1 - B.T)[None, :, :]  # (J2, N, J1)
+
+    # Final consumption shares
+    alpha = rng.dirichlet(np.ones(J), size=N).T              # (J, N)
+
+    theta = rng.uniform(1.0, 5.0, size=J)                    # (J,)
+
+    # Expenditure shares with home bias
+    pi = rng.uniform(0.0, 1.0, size=(N, N, J))
+    pi[np.arange(N), np.arange(N), :] += 3 * N
+    pi /= np.sum(pi, axis=1, keepdims=True)                  # (N, N, J)
+
+    # Tariffs on foreign flows
+    tau = 1 + tariff * rng.uniform(0.0, 1.0, size=(N, N, J))
+    tau[np.arange(N), np.arange(N), :] = 1
+
+    d = {
+        'pi': pi,
+        'w_hat0': np.ones(N),
+        'P_hat0': np.ones((J, N)),
+        'tau_hat': np.ones((N, N, J)),
+        'tau': tau,
+        'taup': tau.copy(),
+    }
+    p.update({
+        'B': B,
+        'G': G,
+        'alpha': alpha,
+        'theta': theta,
+    })
+
+    # Reconcile factor payments and deficits with the gross output implied
+    # by the shares. Value added is linear in income, VA = K (VAn + D):
+    # take VAn near the balanced-trade fixed point and back out D.
+    U = np.zeros((J, N, N))
+    U[:, np.arange(N), np.arange(N)] = alpha
+    U = U.reshape((J * N, N))                                # (J*N, N)
+    Y = lu_solve(factorize_leontief(pi, p, d), U)
+    Y = Y.reshape((J, N, N))                                 # (J, N, N)
+    GO_k = np.einsum('nij,jnk->jik', pi / d['taup'], Y)      # (J, N, N)
+    K = np.sum(B[:, :, None] * GO_k, axis=0)                 # (N, N)
+
+    eigval, eigvec = np.linalg.eig(K)
+    VAn = np.abs(np.real(eigvec[:, np.argmax(np.real(eigval))]))
+    VAn *= 5 * J / np.mean(VAn) * (1 + deficit * rng.standard_normal(N))
+    p['D'] = np.linalg.solve(K, VAn) - VAn                   # (N,)
+
+    d['VAnj'] = alpha * VAn
+    X, xbilat, In, GO, Expenditure, Im, Ex = EX(d['w_hat0'], pi, p, d)
+    VAnj = B * GO
+
+    d.update({
+        'X': X,
+        'GO': GO,
+        'Expenditure': Expenditure,
+        'VAnj': VAnj,
+        'In': In,
+        'xbilat': xbilat,
+        'Im': Im,
+        'Ex': Ex,
+    })
+
+    return p, d
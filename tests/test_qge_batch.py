@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.batch import equilibrium_batch
+from QGE.equilibrium import equilibrium
+from synthetic import synthetic_calibration
+
+
+KEYS = ('w_hat', 'P_hat', 'Pn_hat', 'X', 'pi', 'xbilat', 'In', 'GO',
+        'Expenditure', 'Im', 'Ex', 'VAnj')
+
+
+@pytest.mark.parametrize('solver', ['dense', 'krylov'])
+def test_batch_matches_scenarios_solved_alone(solver):
+    p, d = synthetic_calibration(9, 4)
+    p.update({'tol': 1e-8, 'ex_solver': solver})
+
+    levels = [1.05, 1.2, 1.5, 2.0]
+    tau_hat = np.ones((len(levels),) + d['tau_hat'].shape)
+    for s, level in enumerate(levels):
+        tau_hat[s, :, 1, :] = level
+        tau_hat[s, 1, 1, :] = 1.0
+
+    batch = equilibrium_batch(d, p, tau_hat)
+
+    for s in range(len(levels)):
+        alone = equilibrium(
+            dict(d, tau_hat=tau_hat[s], taup=tau_hat[s] * d['tau']), dict(p))
+        assert batch['it'][s] == alone['it']
+        for key in KEYS:
+            np.testing.assert_allclose(batch[key][s], alone[key],
+                                       rtol=1e-9, atol=1e-12, err_msg=key)
+
+
+@pytest.mark.parametrize('option', [
+    {'eq_solver': 'newton_krylov'}, {'lmc_adaptive': True},
+    {'inexact': True}, {'ep_anderson': 3}, {'continuation': True},
+])
+def test_batch_rejects_other_solver_options(option):
+    p, d = synthetic_calibration(5, 2)
+    p.update(option)
+
+    with pytest.raises(ValueError):
+        equilibrium_batch(d, p, d['tau_hat'][None])
+
+
+def test_run_batch_matches_run(calibration):
+    _, d, _ = calibration
+    ctfs = [
+        {'rule1': [{'importer_indices': [], 'exporter_indices': [1],
+                    'sector_indices': [0], 'tariff_change': change}]}
+        for change in (5.0, 25.0, 50.0)
+    ]
+    ctfs.append({'rule1': [{'importer_indices': [0], 'exporter_indices': [],
+                            'sector_indices': [], 'free_trade': True}]})
+
+    batch, d_batch, _ = QGE.main.run_batch(ctfs)
+
+    assert d_batch['tau_hat'].shape == (len(ctfs),) + d['tau_hat'].shape
+    for s, ctf in enumerate(ctfs):
+        alone, d_alone, _ = QGE.main.run(ctf)
+        np.testing.assert_array_equal(d_batch['tau_hat'][s],
+                                      d_alone['tau_hat'])
+        np.testing.assert_allclose(batch['w_hat'][s], alone['w_hat'],
+                                   rtol=1e-9)
+        np.testing.assert_allclose(batch['Pn_hat'][s], alone['Pn_hat'],
+                                   rtol=1e-9)
+
+
+def test_dense_chunks_follow_the_memory_budget():
+    p, d = synthetic_calibration(9, 4)
+    p.update({'tol': 1e-8})
+    tau_hat = np.ones((3,) + d['tau_hat'].shape)
+    tau_hat[:, :, 1, :] = np.array([1.1, 1.3, 1.6])[:, None, None]
+    tau_hat[:, 1, 1, :] = 1.0
+
+    reference = equilibrium_batch(d, p, tau_hat)
+    # Room for less than one matrix still solves one scenario at a time
+    one_by_one = equilibrium_batch(d, dict(p, batch_memory=1), tau_hat)
+
+    np.testing.assert_allclose(one_by_one['w_hat'], reference['w_hat'],
+                               rtol=1e-12)
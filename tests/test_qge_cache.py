@@ -0,0 +1,107 @@
+import os
+import sys
+
+import numpy as np
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.cache import ResultCache
+
+
+def _tariff(change, exporters=(1,)):
+    return {'rule1': [{'importer_indices': [],
+                       'exporter_indices': list(exporters),
+                       'sector_indices': [], 'tariff_change': change}]}
+
+
+def test_repeated_counterfactual_is_served_from_cache(calibration, tmp_path,
+                                                      monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    first, _, _ = QGE.main.run(_tariff(20.0), cache=cache)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('cached counterfactual was solved again')
+
+    monkeypatch.setattr(QGE.main, 'equilibrium', fail)
+    # A different payload that compiles to the same tariffs is a hit too
+    ctf = {'a': {'exporter_indices': [1], 'tariff_change': 10.0},
+           'b': {'exporter_indices': [1], 'tariff_change': 20.0}}
+    second, d, _ = QGE.main.run(ctf, cache=cache)
+
+    assert not first['cached'] and second['cached']
+    np.testing.assert_array_equal(second['w_hat'], first['w_hat'])
+    np.testing.assert_array_equal(d['tau_hat'][:, 1, 0],
+                                  np.where(np.arange(6) == 1, 1.0, 1.2))
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_settings_and_calibration_are_part_of_the_key(calibration, tmp_path,
+                                                     monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    QGE.main.run(_tariff(20.0), cache=cache)
+
+    output, _, _ = QGE.main.run(_tariff(20.0), options={'tol': 1e-8},
+                                cache=cache)
+    assert not output['cached']
+
+    p, d, _ = calibration
+    d = dict(d, tau=d['tau'] * 1.01)
+    monkeypatch.setattr(QGE.main, '_load_calibrated_state',
+                        lambda output_dir: (p, d, d))
+    output, _, _ = QGE.main.run(_tariff(20.0), cache=cache)
+    assert not output['cached']
+    assert cache.stats()['misses'] == 3
+
+
+def test_solver_version_is_part_of_the_key(calibration, tmp_path,
+                                           monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    QGE.main.run(_tariff(20.0), cache=cache)
+
+    monkeypatch.setattr(QGE.main, 'SOLVER_VERSION',
+                        QGE.main.SOLVER_VERSION + 1)
+    output, _, _ = QGE.main.run(_tariff(20.0), cache=cache)
+    assert not output['cached']
+
+
+def test_unfinished_solves_are_not_cached(calibration, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    output, _, _ = QGE.main.run(_tariff(20.0), budget=0.0, cache=cache)
+
+    assert output['status'] == 'timeout'
+    assert cache.stats()['entries'] == 0
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    value = np.zeros(1000)
+    cache = ResultCache(str(tmp_path), max_bytes=2 * value.nbytes + 1000)
+    cache.put('a', {'x': value})
+    cache.put('b', {'x': value})
+    os.utime(os.path.join(tmp_path, 'a.pkl'), (0, 0))
+    os.utime(os.path.join(tmp_path, 'b.pkl'), (1, 1))
+    assert cache.get('a') is not None
+
+    cache.put('c', {'x': value})
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['entries'] == 2
+
+
+def test_corrupt_entries_are_misses_and_removed(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('a', {'x': np.zeros(1000)})
+    path = os.path.join(tmp_path, 'a.pkl')
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    assert cache.get('a') is None
+    assert not os.path.exists(path)
+    assert cache.stats()['misses'] == 1
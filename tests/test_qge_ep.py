@@ -0,0 +1,105 @@
+import os
+import sys
+
+import numpy as np
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from QGE.EP import EP
+from QGE.TS import TS
+from synthetic import synthetic_calibration
+
+
+def _reference_EP(w_hat, P_hat, d, p):
+    # Loop-based price iteration the vectorized kernel replaced
+    P_err = 1
+    it = 1
+    while P_err > p['tol'] and it < p['maxit']:
+        lw_hat = np.log(w_hat)
+        lP_hat = np.log(P_hat)
+        lw_hat_term = lw_hat.T * p['B']
+        lP_hat_term = np.sum(p['G'] * lP_hat[:, :, None], axis=0).T
+        c_hat = np.exp(lw_hat_term + lP_hat_term)
+        pni_hat = np.empty((p['N'], p['N'], p['J']))
+        for j in range(p['J']):
+            pni_hat[:, :, j] = (c_hat[j, :][None, :] *
+                                d['tau_hat'][:, :, j]) ** (-p['theta'][j])
+        log_sum = np.log(np.sum(d['pi'] * pni_hat, axis=1))
+        P_hat1 = np.exp(log_sum.T / (-p['theta'][:, None]))
+        P_err = np.max(np.abs(P_hat1 - P_hat))
+        it += 1
+        P_hat = P_hat1.copy()
+    Pn_hat = np.prod(P_hat**p['alpha'], axis=0)
+    return P_hat, c_hat, Pn_hat
+
+
+def _shocked_state(N=9, J=4, seed=0):
+    p, d = synthetic_calibration(N, J, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    d['tau_hat'] = 1 + 0.3 * rng.uniform(size=(N, N, J))
+    w_hat = rng.uniform(0.8, 1.2, size=N)
+    P_hat = rng.uniform(0.9, 1.1, size=(J, N))
+    return w_hat, P_hat, p, d
+
+
+def test_ep_matches_loop_reference():
+    w_hat, P_hat, p, d = _shocked_state()
+    P_hat0 = P_hat.copy()
+
+    expected = _reference_EP(w_hat, P_hat, d, p)
+    result = EP(w_hat, P_hat, d, p)
+
+    for e, r in zip(expected, result):
+        np.testing.assert_allclose(r, e, rtol=1e-12)
+    np.testing.assert_array_equal(P_hat, P_hat0)
+
+
+def test_ep_workspace_is_reused_across_calls():
+    w_hat, P_hat, p, d = _shocked_state()
+    ws = {}
+
+    first = EP(w_hat, P_hat, d, p, ws=ws)
+    buffers = {key: id(buf) for key, buf in ws.items() if key != 'pni_c_hat'}
+    second = EP(w_hat, first[0], d, p, ws=ws)
+
+    assert buffers == {key: id(ws[key]) for key in buffers}
+    np.testing.assert_allclose(second[0], first[0], rtol=1e-8)
+
+
+def test_anderson_acceleration_matches_picard_in_fewer_sweeps():
+    w_hat, P_hat, p, d = _shocked_state()
+
+    picard_info, anderson_info = {}, {}
+    expected = EP(w_hat, P_hat, d, p, info=picard_info)
+    p['ep_anderson'] = 5
+    result = EP(w_hat, P_hat, d, p, info=anderson_info)
+
+    for e, r in zip(expected, result):
+        np.testing.assert_allclose(r, e, rtol=1e-8)
+    assert anderson_info['anderson_steps'] > 0
+    assert anderson_info['it'] < picard_info['it']
+
+
+def test_ts_reuses_ep_tensor_and_matches_loop_reference():
+    w_hat, P_hat, p, d = _shocked_state()
+    ws = {}
+    P_hat, c_hat, _ = EP(w_hat, P_hat, d, p, ws=ws)
+
+    expected = np.empty_like(d['pi'])
+    for j in range(p['J']):
+        expected[:, :, j] = d['pi'][:, :, j] * (
+            (c_hat[j, :][None, :] * d['tau_hat'][:, :, j]) /
+            P_hat[j, :][:, None]) ** (-p['theta'][j])
+
+    standalone, pi_hat = TS(c_hat, P_hat, d, p)
+    fused, _ = TS(c_hat, P_hat, d, p, ws=ws)
+
+    np.testing.assert_allclose(standalone, expected, rtol=1e-12)
+    np.testing.assert_allclose(fused, expected, rtol=1e-12)
+    np.testing.assert_allclose(standalone, d['pi'] * pi_hat, rtol=1e-12)
+    assert 'pni_hat' not in ws
@@ -0,0 +1,209 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from QGE.equilibrium import equilibrium
+from synthetic import synthetic_calibration
+
+
+def _scenario(level=1.5, N=9, J=4):
+    p, d = synthetic_calibration(N, J)
+    d['tau_hat'][:, 1, :] = level
+    d['tau_hat'][1, 1, :] = 1.0
+    d['taup'] = d['tau_hat'] * d['tau']
+    p.update({'tol': 1e-8, 'ex_solver': 'krylov'})
+    return p, d
+
+
+def test_newton_krylov_matches_picard():
+    p, d = _scenario()
+
+    reference = equilibrium(d, p)
+    result = equilibrium(d, p, solver='newton_krylov')
+
+    assert result['it'] < reference['it']
+    np.testing.assert_allclose(result['w_hat'], reference['w_hat'], rtol=1e-7)
+    np.testing.assert_allclose(result['Pn_hat'], reference['Pn_hat'],
+                               rtol=1e-7)
+
+
+def test_solver_is_selectable_through_p():
+    p, d = _scenario()
+    p['eq_solver'] = 'newton_krylov'
+    output = equilibrium(d, p)
+    assert output['evals'] > output['it']
+
+    p['eq_solver'] = 'secant'
+    with pytest.raises(ValueError):
+        equilibrium(d, p)
+
+
+def test_adaptive_damping_reports_steps_and_matches_fixed():
+    p, d = _scenario(level=3.0)
+
+    reference = equilibrium(d, p)
+    p['lmc_adaptive'] = True
+    result = equilibrium(d, p)
+
+    assert result['it'] < reference['it']
+    assert len(result['v']) == result['it']
+    assert np.all(reference['v'] == p['v'])
+    np.testing.assert_allclose(result['w_hat'], reference['w_hat'], rtol=1e-6)
+
+
+def test_inexact_inner_solves_reach_the_same_equilibrium():
+    p, d = _scenario(level=3.0)
+
+    reference = equilibrium(d, p)
+    p['inexact'] = True
+    result = equilibrium(d, p)
+
+    assert result['ep_it'] < reference['ep_it']
+    np.testing.assert_allclose(result['w_hat'], reference['w_hat'], rtol=1e-6)
+    np.testing.assert_allclose(result['P_hat'], reference['P_hat'], rtol=1e-6)
+
+
+@pytest.mark.parametrize('level', [1.05, 1.2])
+def test_inexact_inner_solves_keep_the_outer_iteration_count(level):
+    p, d = _scenario(level=level)
+
+    reference = equilibrium(d, p)
+    p['inexact'] = True
+    result = equilibrium(d, p)
+
+    assert result['it'] <= 1.5 * reference['it']
+
+
+def test_anderson_counts_are_reported():
+    p, d = _scenario()
+
+    reference = equilibrium(d, p)
+    p['ep_anderson'] = 5
+    result = equilibrium(d, p)
+
+    assert reference['anderson_steps'] == reference['anderson_restarts'] == 0
+    assert result['anderson_steps'] > 0
+    for key in ('anderson_steps', 'anderson_restarts'):
+        assert result[key] == sum(r[key] for r in result['telemetry'])
+
+
+@pytest.mark.parametrize('solver', ['picard', 'newton_krylov'])
+def test_telemetry_records_are_streamed_without_printing(solver, capsys):
+    p, d = _scenario()
+    records = []
+    output = equilibrium(d, p, solver=solver, callback=records.append)
+
+    assert capsys.readouterr().out == ''
+    assert records == output['telemetry']
+    assert records[-1]['it'] == output['it']
+    assert records[-1]['Z_err'] <= p['tol']
+    for record in records:
+        assert set(record['time']) == {'EP', 'TS', 'EX', 'LMC'}
+        assert record['ep_it'] >= 0 and record['evals'] >= 0
+
+
+@pytest.mark.parametrize('solver', ['picard', 'newton_krylov'])
+def test_time_budget_returns_partial_state(solver):
+    p, d = _scenario(level=3.0)
+
+    output = equilibrium(d, p, solver=solver, budget=0.0)
+
+    assert output['status'] == 'timeout'
+    assert output['it'] <= 1
+    assert np.all(np.isfinite(output['w_hat']))
+    assert np.all(np.isfinite(output['P_hat']))
+    assert equilibrium(d, p, solver=solver)['status'] == 'converged'
+
+
+@pytest.mark.parametrize('solver', ['picard', 'newton_krylov'])
+def test_cancel_token_stops_the_solve(solver):
+    p, d = _scenario(level=3.0)
+    cancel = threading.Event()
+
+    def progress(record):
+        if record['it'] == 1:
+            cancel.set()
+
+    output = equilibrium(d, p, solver=solver, callback=progress,
+                         cancel=cancel)
+
+    assert output['status'] == 'cancelled'
+    assert output['it'] == 1
+    assert output['telemetry'][-1]['Z_err'] > p['tol']
+
+
+def _shock(level, N=9, J=4):
+    # The same tariff change on every foreign flow
+    p, d = synthetic_calibration(N, J)
+    d['tau_hat'][:] = level
+    d['tau_hat'][np.arange(N), np.arange(N), :] = 1.0
+    d['taup'] = d['tau_hat'] * d['tau']
+    p.update({'tol': 1e-8, 'ex_solver': 'krylov'})
+    return p, d
+
+
+def test_continuation_solves_large_shocks_in_fewer_evaluations():
+    p, d = _shock(level=11.0)
+
+    reference = equilibrium(d, p, solver='newton_krylov')
+    records = []
+    p['continuation'] = True
+    result = equilibrium(d, p, solver='newton_krylov',
+                         callback=records.append)
+
+    assert result['evals'] < reference['evals'] / 2
+    steps = [step['s'] for step in result['continuation']]
+    assert steps == sorted(steps) and steps[-1] == 1.0
+    assert {record['s'] for record in records} == set(steps)
+    np.testing.assert_allclose(result['w_hat'], reference['w_hat'], rtol=1e-7)
+    np.testing.assert_allclose(result['Pn_hat'], reference['Pn_hat'],
+                               rtol=1e-7)
+
+
+def test_continuation_halves_failed_steps():
+    p, d = _scenario(level=3.0)
+
+    reference = equilibrium(d, p)
+    # Loose path steps capped at 8 iterations, then polished to tol
+    p.update({'continuation': True, 'cont_step': 1.0, 'cont_maxit': 8,
+              'cont_tol': 1e-4})
+    result = equilibrium(d, p)
+
+    steps = result['continuation']
+    assert [step['s'] for step in steps[:3]] == [1.0, 0.5, 0.25]
+    assert not steps[0]['converged'] and steps[2]['converged']
+    assert steps[-1] == {'s': 1.0, 'it': steps[-1]['it'], 'converged': True}
+    np.testing.assert_allclose(result['w_hat'], reference['w_hat'], rtol=1e-6)
+
+    p['cont_min_step'] = 0.5
+    with pytest.raises(RuntimeError, match='Continuation stalled'):
+        equilibrium(d, p)
+
+
+def test_continuation_step_cap_leaves_price_sweeps_alone(monkeypatch):
+    import QGE.equilibrium
+
+    p, d = _scenario(level=3.0)
+    p.update({'continuation': True, 'cont_maxit': 8, 'cont_tol': 1e-4,
+              'maxit': 500})
+    caps = set()
+    ep = QGE.equilibrium.EP
+
+    def capped_ep(w_hat, P_hat, d, p, **kwargs):
+        caps.add(p['maxit'])
+        return ep(w_hat, P_hat, d, p, **kwargs)
+
+    monkeypatch.setattr(QGE.equilibrium, 'EP', capped_ep)
+    equilibrium(d, p)
+
+    assert caps == {500}
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from QGE.EX import EX, factorize_leontief
+from QGE.equilibrium import equilibrium
+from synthetic import synthetic_calibration
+
+
+def _shocked_state(N=9, J=4, seed=0):
+    p, d = synthetic_calibration(N, J, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    d['tau_hat'] = 1 + 0.3 * rng.uniform(size=(N, N, J))
+    d['taup'] = d['tau_hat'] * d['tau']
+    w_hat = rng.uniform(0.8, 1.2, size=N)
+    return w_hat, p, d
+
+
+@pytest.mark.parametrize('solver', ['woodbury', 'krylov'])
+def test_ex_solvers_match_dense_reference(solver):
+    w_hat, p, d = _shocked_state()
+
+    reference = EX(w_hat, d['pi'], p, d)
+    p['ex_solver'] = solver
+    result = EX(w_hat, d['pi'], p, d)
+
+    for expected, actual in zip(reference, result):
+        np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-10)
+
+
+def test_unknown_ex_solver_is_rejected():
+    w_hat, p, d = _shocked_state()
+    p['ex_solver'] = 'cholesky'
+
+    with pytest.raises(ValueError):
+        EX(w_hat, d['pi'], p, d)
+
+
+def test_krylov_equilibrium_matches_dense():
+    p, d = synthetic_calibration(9, 4)
+    d['tau_hat'][:, 1, :] = 1.2
+    d['tau_hat'][1, 1, :] = 1.0
+    d['taup'] = d['tau_hat'] * d['tau']
+    p['tol'] = 1e-8
+
+    reference = equilibrium(d, p)
+    p['ex_solver'] = 'krylov'
+    result = equilibrium(d, p)
+
+    np.testing.assert_allclose(result['w_hat'], reference['w_hat'], rtol=1e-8)
+    np.testing.assert_allclose(result['X'], reference['X'], rtol=1e-8)
+
+
+def test_krylov_with_baseline_preconditioner_matches_dense():
+    p, d = synthetic_calibration(9, 4)
+    lu = factorize_leontief(d['pi'], dict(p), d)
+    w_hat, p, d = _shocked_state()
+
+    reference = EX(w_hat, d['pi'], p, d)
+    p.update({'ex_solver': 'krylov', '_ex_lu': lu})
+    result = EX(w_hat, d['pi'], p, d)
+
+    for expected, actual in zip(reference, result):
+        np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-10)
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import numpy as np
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+
+
+# Size of the synthetic calibration fixture (conftest.py)
+CALIBRATION = (9, 4)
+
+
+def _tariff(change):
+    return {'rule1': [{'importer_indices': [0, 2], 'exporter_indices': [1],
+                       'sector_indices': [], 'tariff_change': change}]}
+
+
+def test_preview_is_first_order_accurate(calibration):
+    errors = []
+    for change in (1.0, 2.0):
+        estimate, _, _ = QGE.main.preview(_tariff(change))
+        solved, _, _ = QGE.main.run(_tariff(change), options={'tol': 1e-10})
+        error = {key: np.max(np.abs(np.log(estimate[key] / solved[key])))
+                 for key in ('w_hat', 'Pn_hat', 'In', 'Ex', 'Im')}
+        # The indicator has the size of the price and wage errors
+        price_error = max(error['w_hat'], error['Pn_hat'])
+        assert price_error / 10 < estimate['error'] < 10 * price_error
+        errors.append(list(error.values()))
+
+    assert estimate['linear']
+    # Halving the shock quarters the error
+    ratio = np.array(errors[1]) / np.array(errors[0])
+    assert np.all((3 < ratio) & (ratio < 5))
+
+
+def test_preview_without_tariff_changes_is_the_baseline(calibration):
+    p, d, baseline = calibration
+    estimate, _, _ = QGE.main.preview({})
+
+    np.testing.assert_allclose(estimate['w_hat'], 1.0)
+    np.testing.assert_allclose(estimate['Pn_hat'], 1.0)
+    for key in ('In', 'GO', 'Ex', 'Im', 'xbilat'):
+        np.testing.assert_allclose(estimate[key], baseline[key])
+    assert estimate['error'] == 0.0
+
+
+def test_adjoint_welfare_gradient_matches_finite_differences(calibration):
+    p, d, baseline = calibration
+    ctf = _tariff(20.0)
+    options = {'tol': 1e-11}
+    gradient, counterfactual = QGE.main.welfare_gradient(ctf, [0, 3],
+                                                         options)
+    assert gradient.shape == (2, 9, 9, 4)
+
+    def welfare(ctf):
+        output, d_ctf, _ = QGE.main.run(ctf, options)
+        return output['In'] / d_ctf['In'] / output['Pn_hat'], d_ctf['tau_hat']
+
+    welfare0, tau_hat = welfare(ctf)
+    h = 1e-5
+    # Domestic flows are never tariffed
+    assert np.all(gradient[:, np.arange(9), np.arange(9), :] == 0)
+    # A line the rule sets and one it leaves at the baseline
+    for n, i, j in [(0, 1, 2), (3, 5, 1)]:
+        line = {'importer_indices': [n], 'exporter_indices': [i],
+                'sector_indices': [j],
+                'tariff_change': (tau_hat[n, i, j] * (1 + h) - 1) * 100}
+        welfare1, _ = welfare(dict(ctf, line=line))
+        expected = (welfare1 - welfare0)[[0, 3]] / (tau_hat[n, i, j] * h)
+        np.testing.assert_allclose(gradient[:, n, i, j], expected,
+                                   rtol=1e-3, atol=1e-8)
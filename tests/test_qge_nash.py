@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.nash import tariff_war
+from QGE.optimal import tariff_rules
+
+
+# Size of the synthetic calibration fixture (conftest.py)
+CALIBRATION = (6, 2)
+
+
+def _welfare(country, tariffs):
+    ctf = {f'tariffs_{c}': tariff_rules(c, changes)
+           for c, changes in tariffs.items()}
+    output, d, _ = QGE.main.run(ctf)
+    return output['In'][country] / d['In'][country] / \
+        output['Pn_hat'][country]
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_tariff_war_streams_rounds_to_a_nash_equilibrium(workers,
+                                                         calibration):
+    # Forked workers inherit the patched calibration
+    rounds = list(tariff_war([0, 3], workers=workers, mp_context='fork'))
+
+    assert [r['round'] for r in rounds] == list(range(1, len(rounds) + 1))
+    assert rounds[-1]['converged']
+    assert not any(r['converged'] for r in rounds[:-1])
+    # Later rounds start from the previous best response
+    assert rounds[-1]['evals'][0] < rounds[0]['evals'][0]
+
+    tariffs = rounds[-1]['tariff_change']
+    assert np.all(tariffs[0] > 0) and np.all(tariffs[3] > 0)
+    # Neither country gains by moving its tariffs alone
+    for country in (0, 3):
+        welfare = _welfare(country, tariffs)
+        for j in range(2):
+            for step in (-2.0, 2.0):
+                moved = dict(tariffs)
+                moved[country] = tariffs[country].copy()
+                moved[country][j] += step
+                assert _welfare(country, moved) < welfare
+
+
+def test_tariff_war_raises_without_convergence(calibration):
+    with pytest.raises(RuntimeError, match='did not converge'):
+        list(tariff_war([0, 3], workers=0, max_rounds=1))
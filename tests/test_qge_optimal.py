@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.optimal import optimal_tariffs, tariff_rules
+
+
+# Size of the synthetic calibration fixture (conftest.py)
+CALIBRATION = (7, 3)
+
+
+def _welfare(country, changes):
+    output, d, _ = QGE.main.run({'rule1': tariff_rules(country, changes)})
+    return output['In'][country] / d['In'][country] / \
+        output['Pn_hat'][country]
+
+
+def test_optimal_tariffs_beat_nearby_tariff_vectors(calibration):
+    records = []
+    result = optimal_tariffs(2, callback=records.append)
+
+    assert result['success']
+    assert result['evals'] == len(records) == len(result['history'])
+    assert np.all(result['tariff_change'] > 0)
+    assert result['welfare'] > _welfare(2, np.zeros(3))
+    # A local maximum: moving any sector's tariff lowers welfare
+    for j in range(3):
+        for step in (-2.0, 2.0):
+            changes = result['tariff_change'].copy()
+            changes[j] += step
+            assert _welfare(2, changes) < result['welfare']
+
+
+def test_optimal_tariffs_respect_bounds_and_other_rules(calibration):
+    # Other countries' tariffs stay in force while country 0 optimizes
+    others = {'rule1': tariff_rules(1, [30.0, 30.0, 30.0])}
+    result = optimal_tariffs(0, ctf=others, bounds=(0.0, 5.0))
+
+    assert np.all(result['tariff_change'] >= 0)
+    assert np.all(result['tariff_change'] <= 5.0)
+    assert list(result['ctf']) == ['rule1', 'tariffs_0']
+    assert result['ctf']['rule1'] == others['rule1']
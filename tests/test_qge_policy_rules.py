@@ -26,7 +26,9 @@ def test_run_handles_free_trade_with_null_tariff_change():
 
     output, d, _ = run(ctf)
 
-    assert output['it'] >= 1
+    # Free trade on an untariffed line leaves tau_hat unchanged, and the
+    # baseline is returned without solving
+    assert output['noop'] and output['it'] == 0
     assert d['tau_hat'][0, 1, 0] == 1.0
     assert d['tau_hat'][0, 0, 0] == 1.0
 
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.equilibrium import equilibrium
+from QGE.profiling import Profiler
+from synthetic import synthetic_calibration
+
+
+def _tariff_on_exporter_1(d):
+    d['tau_hat'][:, 1, :] = 1.5
+    d['tau_hat'][1, 1, :] = 1.0
+    d['taup'] = d['tau_hat'] * d['tau']
+
+
+def test_profiler_records_every_stage_call():
+    p, d = synthetic_calibration(9, 4)
+    _tariff_on_exporter_1(d)
+    p['tol'] = 1e-8
+
+    with Profiler() as profiler:
+        output = equilibrium(d, dict(p, _profiler=profiler))
+    stages = profiler.summary()
+
+    assert set(stages) == {'EP', 'TS', 'EX', 'EX.assemble', 'EX.solve',
+                           'LMC'}
+    for name in stages:
+        assert stages[name]['calls'] == output['evals']
+    assert stages['EX.solve']['total'] <= stages['EX']['total']
+    # The dense solver assembles an (N*J, N*J) matrix on every call
+    assert stages['EX.assemble']['peak_bytes'] >= 8 * (9 * 4) ** 2
+    assert stages['EX']['peak_bytes'] >= stages['EX.assemble']['peak_bytes']
+
+
+def test_run_returns_and_writes_profile(tmp_path, calibration):
+    ctf = {'rule1': [{'importer_indices': [], 'exporter_indices': [1],
+                      'sector_indices': [], 'tariff_change': 20.0}]}
+
+    path = tmp_path / 'profile.json'
+    output, _, p_out = QGE.main.run(ctf, profile=str(path))
+
+    assert '_profiler' not in p_out
+    assert {'load', 'copy', 'rules', 'equilibrium', 'EP', 'EX.solve'} <= \
+        set(output['profile']['stages'])
+    assert json.loads(path.read_text()) == output['profile']
+    assert len(output['profile']['calls']['LMC']['time']) == output['it']
+
+    reference, _, _ = QGE.main.run(ctf)
+    assert 'profile' not in reference
+    np.testing.assert_allclose(output['w_hat'], reference['w_hat'])
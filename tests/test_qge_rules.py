@@ -0,0 +1,98 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+import QGE.rules
+from QGE.rules import apply_rules, compile_rules, iter_counterfactual_rules
+
+
+def _reference_tau_hat(ctf, tau_hat, tau):
+    # Rule application as run did it before rules were compiled
+    N, J = tau.shape[0], tau.shape[2]
+    tau_hat = tau_hat.copy()
+    for rule in iter_counterfactual_rules(ctf, N, J):
+        importers = rule['importers']
+        exporters = rule['exporters']
+        sectors = rule['sectors']
+
+        if rule['free_trade']:
+            tau_hat[np.ix_(importers, exporters, sectors)] = 1 / \
+                tau[np.ix_(importers, exporters, sectors)]
+        else:
+            tariff_change = rule['tariff_change']
+            if tariff_change is None:
+                tariff_change = 0.0
+            tau_hat[np.ix_(importers, exporters, sectors)] = 1 + \
+                tariff_change / 100
+
+        for importer in importers:
+            for sector in sectors:
+                tau_hat[importer, importer, sector] = 1
+    return tau_hat
+
+
+def _random_ctf(rng, N, J, rules):
+    def subset(size):
+        if rng.uniform() < 0.2:
+            return []
+        return rng.choice(size, rng.integers(1, size + 1),
+                          replace=False).tolist()
+
+    entries = [{
+        'importer_indices': subset(N),
+        'exporter_indices': subset(N),
+        'sector_indices': subset(J),
+        'free_trade': bool(rng.uniform() < 0.3),
+        'tariff_change': rng.choice([None, 0.0, 5.0, -10.0, 50.0]),
+    } for _ in range(rules)]
+    return {'rule1': entries[:rules // 2], 'rule2': entries[rules // 2:]}
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('block, chunk', [(1 << 12, 1 << 22), (0, 1),
+                                          (20, 50)])
+def test_compiled_rules_match_sequential_application(seed, block, chunk,
+                                                     monkeypatch):
+    # Small limits send blocks through the broadcast path and split the
+    # expanded ones into many chunks
+    monkeypatch.setattr(QGE.rules, 'BLOCK', block)
+    monkeypatch.setattr(QGE.rules, 'CHUNK', chunk)
+    rng = np.random.default_rng(seed)
+    N, J = 7, 4
+    tau = 1 + rng.uniform(0.0, 0.3, size=(N, N, J))
+    tau_hat = rng.uniform(0.9, 1.1, size=(N, N, J))
+    ctf = _random_ctf(rng, N, J, rules=12)
+    ctf['last'] = {'importer_indices': [-1], 'exporter_indices': [0],
+                   'sector_indices': [1], 'tariff_change': 25.0}
+
+    expected = _reference_tau_hat(ctf, tau_hat, tau)
+    assert apply_rules(compile_rules(ctf, N, J), tau_hat, tau)
+    np.testing.assert_array_equal(tau_hat, expected)
+
+
+def test_out_of_range_indices_raise():
+    with pytest.raises(IndexError):
+        compile_rules({'rule1': {'importer_indices': [7]}}, 7, 4)
+
+
+def test_noop_scenarios_skip_the_solve(calibration):
+    _, _, baseline = calibration
+
+    empty_rule = {'rule1': [{'exporter_indices': [2], 'tariff_change': 0.0}]}
+    output, _, _ = QGE.main.run(empty_rule)
+    assert output['noop'] and output['it'] == 0
+    np.testing.assert_array_equal(output['w_hat'], baseline['w_hat'])
+
+    output, _, _ = QGE.main.run({'rule1': [{'exporter_indices': [2],
+                                            'tariff_change': 1.0}]})
+    assert 'noop' not in output and output['it'] > 0
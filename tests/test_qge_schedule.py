@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+
+
+# Size of the synthetic calibration fixture (conftest.py)
+CALIBRATION = (12, 4)
+
+
+def _stage(change, importers=(0, 1, 2)):
+    return {'rule1': [{'importer_indices': list(importers),
+                       'exporter_indices': [], 'sector_indices': [],
+                       'tariff_change': change}]}
+
+
+def test_schedule_matches_stages_solved_from_scratch(calibration):
+    p, d, baseline = calibration
+    # +10% a quarter for four quarters
+    ctfs = [_stage(10.0 * (k + 1)) for k in range(4)]
+    options = {'tol': 1e-9}
+
+    path, d_path, _ = QGE.main.run_schedule(ctfs, options)
+
+    assert path['w_hat'].shape == (4, 12)
+    assert path['welfare'].shape == (4, 12)
+    assert d_path['tau_hat'].shape == (4,) + d['tau_hat'].shape
+    assert path['status'] == ['converged'] * 4
+    alone = [QGE.main.run(ctf, options) for ctf in ctfs]
+    for k, (output, d_alone, _) in enumerate(alone):
+        np.testing.assert_array_equal(d_path['tau_hat'][k],
+                                      d_alone['tau_hat'])
+        np.testing.assert_allclose(path['w_hat'][k], output['w_hat'],
+                                   rtol=1e-7)
+        np.testing.assert_allclose(
+            path['welfare'][k],
+            output['In'] / baseline['In'] / output['Pn_hat'], rtol=1e-7)
+    # Later stages start from the path already solved
+    assert path['it'][0] == alone[0][0]['it']
+    assert np.sum(path['it']) < sum(output['it'] for output, _, _ in alone)
+
+
+def test_schedule_stages_build_on_each_other(calibration):
+    records = []
+    ctfs = [_stage(20.0), _stage(20.0), _stage(50.0, importers=[5])]
+
+    path, d_path, _ = QGE.main.run_schedule(ctfs, callback=records.append)
+
+    # Repeating the tariffs in force solves nothing
+    assert path['it'][1] == 0
+    np.testing.assert_array_equal(path['w_hat'][1], path['w_hat'][0])
+    assert {record['stage'] for record in records} == {0, 2}
+    # The last stage keeps the first one's tariffs
+    both, _, _ = QGE.main.run({**_stage(20.0),
+                               'rule2': _stage(50.0, [5])['rule1']})
+    np.testing.assert_allclose(path['w_hat'][2], both['w_hat'], rtol=1e-5)
+    np.testing.assert_array_equal(d_path['tau_hat'][2][0],
+                                  d_path['tau_hat'][0][0])
+
+
+def test_empty_schedule_is_rejected():
+    with pytest.raises(ValueError, match='at least one phase'):
+        QGE.main.run_schedule([])
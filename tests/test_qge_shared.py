@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.shared import attach_state, publish_state
+from synthetic import synthetic_calibration
+
+
+def test_attached_state_is_a_read_only_map_of_the_published_one(tmp_path):
+    p, d = synthetic_calibration(5, 3)
+    baseline = dict(d, telemetry=[{'it': 1}])
+    publish_state((p, d, baseline), str(tmp_path))
+
+    p_map, d_map, baseline_map = attach_state(str(tmp_path))
+
+    assert p_map['N'] == 5 and baseline_map['telemetry'] == [{'it': 1}]
+    assert isinstance(d_map['pi'], np.memmap)
+    np.testing.assert_array_equal(p_map['G'], p['G'])
+    with pytest.raises(ValueError):
+        d_map['tau_hat'][0, 1, 0] = 2.0
+
+
+def test_run_on_shared_state_copies_only_scenario_arrays(tmp_path,
+                                                         calibration):
+    ctf = {'rule1': [{'importer_indices': [], 'exporter_indices': [1],
+                      'sector_indices': [], 'tariff_change': 30.0}]}
+    reference, _, _ = QGE.main.run(ctf)
+
+    publish_state(calibration, str(tmp_path))
+    QGE.main.use_shared_state(str(tmp_path))
+    try:
+        output, d_run, _ = QGE.main.run(ctf)
+    finally:
+        QGE.main.use_shared_state(None)
+
+    assert isinstance(d_run['pi'], np.memmap)
+    assert not isinstance(d_run['tau_hat'], np.memmap)
+    assert d_run['tau_hat'][0, 1, 0] == pytest.approx(1.3)
+    np.testing.assert_allclose(output['w_hat'], reference['w_hat'])
+
+
+@pytest.mark.parametrize('solver', ['dense', 'woodbury', 'krylov'])
+def test_run_leaves_the_cached_calibration_untouched(solver, calibration):
+    p, d, baseline = calibration
+    p_keys, d_before = set(p), {key: np.copy(d[key]) for key in d}
+    ctf = {'rule1': [{'importer_indices': [0], 'exporter_indices': [],
+                      'sector_indices': [], 'free_trade': True}]}
+
+    _, d_run, p_run = QGE.main.run(ctf, {'ex_solver': solver})
+
+    assert set(p) == p_keys
+    assert not d_run['pi'].flags.writeable
+    assert np.shares_memory(d_run['pi'], baseline['pi'])
+    for key, value in d_before.items():
+        np.testing.assert_array_equal(d[key], value, err_msg=key)
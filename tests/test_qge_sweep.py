@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.sweep import expand_grid, sweep
+
+
+def test_expand_grid_takes_the_product_of_fields():
+    grid = {'tariff_change': [5.0, 10.0, 20.0],
+            'exporter_indices': [[1], [2, 3]]}
+    scenarios = list(expand_grid(grid))
+
+    assert len(scenarios) == 6
+    params, ctf = scenarios[-1]
+    assert params == {'tariff_change': 20.0, 'exporter_indices': [2, 3]}
+    assert ctf == {'rule1': [params]}
+
+    with pytest.raises(ValueError):
+        list(expand_grid({'tariff': [5.0]}))
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_sweep_streams_the_results_of_run(workers, calibration):
+    grid = {'tariff_change': [10.0, 40.0], 'sector_indices': [[0], [1, 2]]}
+
+    # Forked workers inherit the patched calibration
+    records = list(sweep(grid, workers=workers, keys=('w_hat', 'it'),
+                         mp_context='fork'))
+
+    assert sorted(record['index'] for record in records) == [0, 1, 2, 3]
+    for record in records:
+        reference, _, _ = QGE.main.run({'rule1': [record['params']]})
+        assert set(record['result']) == {'w_hat', 'it'}
+        np.testing.assert_allclose(record['result']['w_hat'],
+                                   reference['w_hat'])
+
+
+def _blas_limits():
+    # The thread limits a worker's BLAS sees
+    limits = {var: os.environ.get(var) for var in
+              ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS')}
+    try:
+        from threadpoolctl import threadpool_info
+    except ImportError:
+        pass
+    else:
+        limits['blas'] = max(info['num_threads']
+                             for info in threadpool_info())
+    return limits
+
+
+@pytest.mark.parametrize('mp_context', ['spawn', 'fork'])
+def test_pool_workers_see_the_blas_thread_limit(mp_context):
+    from QGE.sweep import pool
+
+    with pool(workers=1, blas_threads=1, mp_context=mp_context,
+              shared=False) as executor:
+        limits = executor.submit(_blas_limits).result()
+
+    assert limits['OMP_NUM_THREADS'] == '1'
+    assert limits['OPENBLAS_NUM_THREADS'] == '1'
+    assert limits.get('blas', 1) == 1
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+
+PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_DIR = os.path.join(PROJECT, 'code')
+
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import QGE.main
+from QGE.warm import SolutionStore, apply_seed
+
+
+def _tariff(change):
+    return {'rule1': [{'importer_indices': [], 'exporter_indices': [1],
+                       'sector_indices': [], 'tariff_change': change}]}
+
+
+@pytest.mark.parametrize('options', [None, {'eq_solver': 'newton_krylov'}])
+@pytest.mark.parametrize('calibration', [(9, 4)], indirect=True)
+def test_warm_started_slider_edits_take_fewer_iterations(options,
+                                                         calibration):
+    _, _, baseline = calibration
+    store = SolutionStore()
+
+    for k, change in enumerate([20.0, 22.0, 25.0]):
+        warm, d_warm, _ = QGE.main.run(_tariff(change), options=options,
+                                       warm_start=store)
+        cold, _, _ = QGE.main.run(_tariff(change), options=options)
+
+        np.testing.assert_allclose(warm['w_hat'], cold['w_hat'], atol=1e-5)
+        assert len(store) == k + 1
+        if k == 0:
+            assert warm['warm_start'] is None
+            assert warm['evals'] == cold['evals']
+        else:
+            assert warm['warm_start'] > 0
+            assert warm['evals'] < cold['evals']
+    # The returned state keeps the baseline output
+    np.testing.assert_array_equal(d_warm['X'], baseline['X'])
+
+
+def test_store_keeps_recent_scenarios_and_prefers_the_baseline_when_closer():
+    N, J = 4, 2
+    base = (np.ones((N, N, J)), {'w_hat': np.ones(N),
+                                 'P_hat': np.ones((J, N)),
+                                 'X': np.ones((J, N))})
+    store = SolutionStore(size=2)
+    for change in (1.1, 1.2, 1.2, 1.3):
+        tau_hat = np.full((N, N, J), change)
+        store.add(tau_hat, {'w_hat': np.full(N, change),
+                            'P_hat': np.full((J, N), change),
+                            'X': np.full((J, N), change)})
+    assert len(store) == 2
+
+    assert store.predict(np.full((N, N, J), 1.05), base) is None
+    # On the line through the two closest scenarios the seed extrapolates
+    distance, seed = store.predict(np.full((N, N, J), 1.4), base)
+    assert distance == pytest.approx(N * N * J * np.log(1.4 / 1.3), rel=1e-5)
+    np.testing.assert_allclose(seed['w_hat'], 1.3 * (1.3 / 1.2) ** (
+        np.log(1.4 / 1.3) / np.log(1.3 / 1.2)), rtol=1e-5)
+    with pytest.raises(ValueError):
+        store._entries[0][1]['X'][0, 0] = 0.0
+
+
+def test_seeds_keep_the_world_value_added_of_the_initial_wages():
+    N, J = 3, 2
+    d = {'VAnj': np.arange(1.0, N * J + 1).reshape(J, N),
+         'w_hat0': np.ones(N)}
+    seed = {'w_hat': np.array([1.0, 2.0, 4.0]), 'P_hat': np.ones((J, N)),
+            'X': np.zeros((J, N))}
+
+    apply_seed(d, seed)
+
+    a = np.sum(d['VAnj'], axis=0)
+    assert a @ d['w_hat0'] == pytest.approx(np.sum(a))
+    np.testing.assert_allclose(d['w_hat0'] / d['w_hat0'][0], seed['w_hat'])
+    assert d['P_hat0'] is seed['P_hat'] and d['X0'] is seed['X']